@@ -1,64 +1,196 @@
 import os
+import time
+import threading
 import requests
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from cassette import cassette_active, get_cassette
+import gemma_client
+import hedging
+from generation_profiles import (
+    DEFAULT_PROFILE, apply_length_hint, generation_config, get_profile, profile_stats
+)
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# WARNING: gemini-2.0-flash-exp is deprecated. 
-# It might be safer to switch to "gemini-2.5-flash" if issues persist.
-GEMINI_MODEL = "gemini-2.0-flash-exp" 
+# Set GEMINI_MODEL to pin a model. Otherwise the model registry picks the fastest
+# listed model for each generation profile (see model_registry.py / list_models.py).
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "")
+FALLBACK_MODEL = "gemini-2.5-flash"
 
-GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
 
 DEFAULT_TIMEOUT = 30
 
+_selected_models: Dict[str, str] = {}
+_selected_lock = threading.Lock()
 
-def get_response(prompt: str, timeout: int = DEFAULT_TIMEOUT) -> Optional[str]:
+
+def model_for(profile: str = DEFAULT_PROFILE) -> str:
+    """Returns the model to use for a profile, asking the registry once per profile per process."""
+    if GEMINI_MODEL:
+        return GEMINI_MODEL
+    if cassette_active():
+        # The payload depends on the model (thinkingConfig) and cassettes match on the payload,
+        # so record and replay must resolve the same model, without the registry's network calls.
+        return FALLBACK_MODEL
+    with _selected_lock:
+        if profile not in _selected_models:
+            from model_registry import select_model  # model_registry imports this module
+            _selected_models[profile] = select_model(profile)
+        return _selected_models[profile]
+
+
+def model_url(model: str, method: str = "generateContent") -> str:
+    return f"{GEMINI_API_BASE}/models/{model}:{method}"
+
+
+def extract_text(data: Dict[str, Any]) -> Optional[str]:
+    """Returns the first candidate's text from a generateContent response, or None if missing."""
+    try:
+        return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def finish_reason(data: Dict[str, Any]) -> str:
+    """Why a response has no text: the finish reason, or the prompt block reason."""
+    try:
+        return data["candidates"][0].get("finishReason", "no text")
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return data.get("promptFeedback", {}).get("blockReason", "no candidates")
+
+
+def build_request(prompt: str, profile: str = DEFAULT_PROFILE,
+                  model: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
     """
-    Sends a prompt to the Gemini API and returns the response text.
-    Includes robust error detection and logging.
+    Returns (generateContent payload, timeout) for prompt under the named profile.
+    model decides whether the profile's thinking budget is sent (see generation_profiles).
+    """
+    settings = get_profile(profile)
+    payload: Dict[str, Any] = {"contents": [{"parts": [{"text": apply_length_hint(prompt, settings)}]}]}
+    config = generation_config(settings, model)
+    if config:
+        payload["generationConfig"] = config
+    return payload, settings.get("timeout", DEFAULT_TIMEOUT)
+
+
+def generate(prompt: str, timeout: Optional[int] = None, profile: str = DEFAULT_PROFILE,
+             model: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
-    if not GEMINI_API_KEY:
+    Sends a prompt to the Gemini API using the named generation profile.
+    model overrides the registry's choice for the profile.
+    Returns {"text", "usage", "latency", "model"} or None on an API/network error.
+    """
+    tape = get_cassette()
+    replay = tape is not None and tape.replaying
+    if not GEMINI_API_KEY and not replay:
         print("API ERROR: GEMINI_API_KEY is not set. Check your .env file.")
         return None
 
+    model = model or model_for(profile)
     if not prompt.strip():
-        return ""
+        return {"text": "", "usage": {}, "latency": 0.0, "model": model}
+
+    payload, profile_timeout = build_request(prompt, profile, model)
+    if timeout is None:
+        timeout = profile_timeout
+
+    if replay:
+        # Served from the cassette: a miss returns None instead of calling the API.
+        result = tape.replay_generate(payload)
+    else:
+        url = f"{model_url(model)}?key={GEMINI_API_KEY}"
+        start = time.perf_counter()
+        if tape is None and hedging.enabled(profile):
+            result = _hedged_generate(prompt, url, payload, timeout, profile)
+        else:
+            result = _post_generate(url, payload, timeout)
+        if tape is not None:
+            tape.record_generate(payload, result, time.perf_counter() - start)
+    if result is not None:
+        result.setdefault("model", model)
+    latency = result["latency"] if result else 0.0
+    output_tokens = result["usage"].get("candidatesTokenCount", 0) if result else 0
+    profile_stats.record(profile, latency, result is not None, output_tokens)
+    return result
+
+
+def _hedged_generate(prompt: str, url: str, payload: Dict[str, Any], timeout: int,
+                     profile: str) -> Optional[Dict[str, Any]]:
+    """generateContent with a hedge to the same model or to local Ollama (see hedging.py)."""
+    primary = lambda session: _post_generate(url, payload, timeout, session, raise_retryable=True)
+    if hedging.HEDGE_MODE == "ollama":
+        settings = get_profile(profile)
+        backup = lambda session: gemma_client.generate(apply_length_hint(prompt, settings), timeout, session,
+                                                       settings.get("max_output_tokens"))
+    else:
+        backup = primary
+    start = time.perf_counter()
+    result = hedging.hedged_call(profile, primary, backup, timeout)
+    if result is not None:
+        # What the caller waited, including the hedge delay when the hedge won
+        result["latency"] = time.perf_counter() - start
+    return result
 
-    url = f"{GEMINI_URL}?key={GEMINI_API_KEY}"
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
 
+def _post_generate(url: str, payload: Dict[str, Any], timeout: int,
+                   session: Optional[requests.Session] = None,
+                   raise_retryable: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Performs the generateContent call, logging any failure. Returns None on error.
+    With raise_retryable, transient failures (5xx, timeout, connection) raise
+    hedging.RetryableError instead, so a hedged call knows a second try may help.
+    """
     try:
-        resp = requests.post(url, json=payload, timeout=timeout)
+        start = time.perf_counter()
+        resp = (session or requests).post(url, json=payload, timeout=timeout)
         resp.raise_for_status() # Raises an exception for 4xx/5xx status codes
-        
+
         data = resp.json()
+        latency = time.perf_counter() - start
 
-        try:
-            return data["candidates"][0]["content"]["parts"][0]["text"].strip()
-        except (KeyError, IndexError, TypeError):
-            print("Bad response format or content blocked. Full response data:")
+        text = extract_text(data)
+        if not text:
+            # Blocked, or cut off (MAX_TOKENS) before any text: an error, not an empty answer.
+            print(f"API ERROR: response has no text ({finish_reason(data)}). Full response data:")
             print(data)
-            return ""
+            return None
+        return {"text": text, "usage": data.get("usageMetadata", {}), "latency": latency}
 
     except requests.exceptions.HTTPError as e:
         print(f"API HTTP ERROR: {e}")
         print(f"Status Code: {e.response.status_code}. Response Text: {e.response.text[:150]}...")
         if e.response.status_code == 400:
              print("HINT: A 400 error often means an invalid API key, model name, or malformed request.")
+        if raise_retryable and e.response.status_code >= 500:
+            raise hedging.RetryableError(str(e)) from e
         return None
-        
+
     except requests.exceptions.Timeout as e:
         print(f"API TIMEOUT ERROR: Request timed out after {timeout} seconds.")
+        if raise_retryable:
+            raise hedging.RetryableError(str(e)) from e
         return None
-        
+
     except requests.exceptions.RequestException as e:
         print(f"API CONNECTION/REQUEST ERROR: {type(e).__name__}: {e}")
+        if raise_retryable and isinstance(e, requests.exceptions.ConnectionError):
+            raise hedging.RetryableError(str(e)) from e
         return None
 
     except Exception as e:
         print(f"API UNEXPECTED ERROR: {type(e).__name__}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_response(prompt: str, timeout: Optional[int] = None,
+                 profile: str = DEFAULT_PROFILE) -> Optional[str]:
+    """
+    Sends a prompt to the Gemini API and returns the response text.
+    Includes robust error detection and logging.
+    """
+    result = generate(prompt, timeout, profile)
+    return None if result is None else result["text"]
@@ -3,6 +3,11 @@ import threading
 from PySide6.QtCore import QObject, Signal
 from typing import Optional
 from ai_client import get_response
+from content_pack import pack_answer
+from generation_profiles import DEFAULT_PROFILE
+from knowledge_base import prepare_prompt
+import remote_client
+from remote_client import CHAT_SERVER_URL
 
 # Signals must inherit from QObject
 class AISignals(QObject):
@@ -21,9 +26,11 @@ class AIWorker(QObject):
     NOTE: We use QObject managing a standard Python thread (threading.Thread) 
     to avoid conflicts between Qt's thread pool and the 'requests' library's I/O.
     """
-    def __init__(self, prompt: str, parent=None):
+    def __init__(self, prompt: str, profile: str = DEFAULT_PROFILE, lesson: Optional[str] = None, parent=None):
         super().__init__(parent)
         self.prompt = prompt
+        self.profile = profile  # Generation profile of the calling surface (see generation_profiles.py)
+        self.lesson = lesson    # Catalog title of the lesson asking, for lesson-scoped pack answers
         self.signals = AISignals()
         self._thread = None
 
@@ -40,7 +47,24 @@ class AIWorker(QObject):
         """
         The actual work to be done in the background thread.
         """
-        reply = get_response(self.prompt)
+        # Scripted lesson content comes from the precompiled pack without any API call.
+        packed = pack_answer(self.prompt, self.lesson)
+        if packed is not None:
+            self.signals.finished.emit(packed)
+            return
+
+        if CHAT_SERVER_URL:
+            # Thin-client mode: the shared server does grounding, caching and rate limiting.
+            reply = remote_client.get_response(self.prompt, self.profile, self.lesson)
+        else:
+            # Strong knowledge-base matches are answered locally; otherwise the
+            # best passages are attached to the prompt before calling the API.
+            direct, prompt = prepare_prompt(self.prompt)
+            if direct is not None:
+                self.signals.finished.emit(direct)
+                return
+
+            reply = get_response(prompt, profile=self.profile)
         
         # Signals are automatically thread-safe (queued to the main thread).
         if reply is not None:
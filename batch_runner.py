@@ -0,0 +1,298 @@
+# batch_runner.py
+"""
+Runs every prompt in a JSONL file through the AI client and appends results to an output JSONL.
+
+    python batch_runner.py requests.jsonl results.jsonl --concurrency 4 --rate 2
+    python batch_runner.py requests.jsonl results.jsonl --batch      # Gemini batch endpoint
+
+Each input line may carry a "prompt" (or "text") field; otherwise "title" and "body" are joined.
+Re-running with the same output file resumes: lines already answered successfully are skipped.
+Failed lines are retried and appended again, so readers should keep the last record per "line".
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import requests
+
+from ai_client import (
+    GEMINI_API_BASE, GEMINI_API_KEY, build_request, extract_text, finish_reason, generate, model_for, model_url
+)
+from generation_profiles import profile_stats
+from rate_limiter import RateLimiter
+
+BATCH_POLL_SECONDS = 30
+BATCH_DONE_STATES = ("BATCH_STATE_SUCCEEDED", "BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED")
+
+
+def _prompt_from_record(record: Dict[str, Any]) -> str:
+    for field in ("prompt", "text"):
+        if isinstance(record.get(field), str):
+            return record[field]
+    parts = [record.get("title", ""), record.get("body", "")]
+    return "\n\n".join(p for p in parts if p)
+
+
+def read_requests(path: str, id_field: str) -> Iterator[Dict[str, Any]]:
+    """Streams input records as {"line", "id", "prompt"} without loading the whole file."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, raw in enumerate(f, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError as e:
+                print(f"BATCH WARNING: skipping line {line_no}: {e}")
+                continue
+            yield {"line": line_no, "id": record.get(id_field, line_no), "prompt": _prompt_from_record(record)}
+
+
+def completed_lines(output_path: str) -> Set[int]:
+    """
+    Returns input line numbers that already have a successful result.
+    A torn last line left by a crash is cut off so new records start on a clean line.
+    """
+    done: Set[int] = set()
+    if not os.path.exists(output_path):
+        return done
+    good_end = 0
+    with open(output_path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError:
+                break
+            good_end += len(raw)
+            if record.get("ok"):
+                done.add(record["line"])
+    if good_end != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(good_end)
+    return done
+
+
+class ResultWriter:
+    """Appends one JSON line per result and flushes immediately so progress survives a crash."""
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def write(self, record: Dict[str, Any]):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.written += 1
+            if not record.get("ok"):
+                self.failed += 1
+
+    def close(self):
+        self._file.close()
+
+
+# ----------------------------
+# Online mode: bounded concurrency + rate limit
+# ----------------------------
+def _run_one(item: Dict[str, Any], limiter: RateLimiter, timeout: Optional[int], profile: str) -> Dict[str, Any]:
+    limiter.acquire()
+    start = time.perf_counter()
+    result = generate(item["prompt"], timeout, profile)
+    # generate() returns None for blocked or cut-off (empty) answers too, so they are retried on resume.
+    record = {"line": item["line"], "id": item["id"], "ok": result is not None,
+              "latency_s": round(time.perf_counter() - start, 3)}
+    if result is not None:
+        record.update({"text": result["text"], "model": result["model"], "usage": result["usage"]})
+    else:
+        record["error"] = "no response (see log)"
+    return record
+
+
+def run_online(items: Iterator[Dict[str, Any]], writer: ResultWriter,
+               concurrency: int, rate: float, timeout: Optional[int], profile: str):
+    limiter = RateLimiter(rate, burst=concurrency)
+    # Keeps at most 2x concurrency prompts in memory while the input is streamed.
+    slots = threading.BoundedSemaphore(concurrency * 2)
+
+    def task(item):
+        try:
+            writer.write(_run_one(item, limiter, timeout, profile))
+        except Exception as e:
+            writer.write({"line": item["line"], "id": item["id"], "ok": False, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for item in items:
+            slots.acquire()
+            pool.submit(task, item)
+
+
+# ----------------------------
+# Offline mode: Gemini batchGenerateContent
+# ----------------------------
+def submit_batch(items: List[Dict[str, Any]], display_name: str, profile: str, model: str) -> Optional[str]:
+    """Submits an inline batch job. Returns the job name (batches/...) or None on error."""
+    url = f"{model_url(model, 'batchGenerateContent')}?key={GEMINI_API_KEY}"
+    payload = {"batch": {
+        "display_name": display_name,
+        "input_config": {"requests": {"requests": [
+            {"request": build_request(item["prompt"], profile, model)[0],
+             "metadata": {"key": str(item["line"])}}
+            for item in items
+        ]}},
+    }}
+    try:
+        resp = requests.post(url, json=payload, timeout=120)
+        resp.raise_for_status()
+        return resp.json()["name"]
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"BATCH SUBMIT ERROR: {type(e).__name__}: {e}")
+        return None
+
+
+def wait_for_batch(name: str, poll: float) -> Optional[Dict[str, Any]]:
+    """Polls a batch job until it finishes. Returns the final operation, or None on error."""
+    url = f"{GEMINI_API_BASE}/{name}?key={GEMINI_API_KEY}"
+    while True:
+        try:
+            resp = requests.get(url, timeout=30)
+            resp.raise_for_status()
+            op = resp.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"BATCH POLL ERROR ({name}): {type(e).__name__}: {e}")
+            return None
+        state = op.get("metadata", {}).get("state", "")
+        if op.get("done") or state in BATCH_DONE_STATES:
+            return op
+        print(f"{name}: {state or 'pending'}...")
+        time.sleep(poll)
+
+
+def _inlined_responses(op: Dict[str, Any]) -> List[Dict[str, Any]]:
+    inlined = op.get("response", {}).get("inlinedResponses", [])
+    if isinstance(inlined, dict):
+        inlined = inlined.get("inlinedResponses", [])
+    return inlined
+
+
+def run_batch(items: Iterator[Dict[str, Any]], writer: ResultWriter, output_path: str,
+              batch_size: int, poll: float, profile: str):
+    # Submitted-but-unfinished jobs are kept next to the output so a restart keeps polling
+    # them instead of submitting (and paying for) the same prompts again.
+    jobs_path = output_path + ".jobs"
+    jobs: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(jobs_path):
+        with open(jobs_path, encoding="utf-8") as f:
+            jobs = json.load(f)
+
+    def save_jobs():
+        with open(jobs_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(jobs, f)
+        os.replace(jobs_path + ".tmp", jobs_path)
+
+    in_flight = {int(line) for job in jobs.values() for line in job["ids"]}
+    chunk: List[Dict[str, Any]] = []
+    model = model_for(profile)
+
+    def flush_chunk():
+        name = submit_batch(chunk, f"batch-runner-{int(time.time())}", profile, model)
+        if name:
+            jobs[name] = {"model": model, "ids": {str(item["line"]): item["id"] for item in chunk}}
+            save_jobs()
+            print(f"Submitted {name} with {len(chunk)} prompts")
+        chunk.clear()
+
+    for item in items:
+        if item["line"] in in_flight:
+            continue
+        chunk.append(item)
+        if len(chunk) >= batch_size:
+            flush_chunk()
+    if chunk:
+        flush_chunk()
+
+    for name in list(jobs):
+        started = time.perf_counter()
+        op = wait_for_batch(name, poll)
+        if op is None:
+            continue
+        ids = jobs[name]["ids"]
+        answered: Set[str] = set()
+        for entry in _inlined_responses(op):
+            key = str(entry.get("metadata", {}).get("key", ""))
+            if key not in ids:
+                continue
+            answered.add(key)
+            response = entry.get("response")
+            text = extract_text(response) if response is not None else None
+            record = {"line": int(key), "id": ids[key], "ok": bool(text),
+                      "latency_s": None, "batch": name}
+            if response is not None:
+                record.update({"text": text or "", "model": jobs[name]["model"],
+                               "usage": response.get("usageMetadata", {})})
+                if not text:
+                    record["error"] = f"empty response ({finish_reason(response)})"
+            else:
+                record["error"] = entry.get("error")
+            writer.write(record)
+        for key in set(ids) - answered:
+            writer.write({"line": int(key), "id": ids[key], "ok": False, "batch": name,
+                          "error": op.get("error") or op.get("metadata", {}).get("state", "no response")})
+        print(f"{name} finished in {time.perf_counter() - started:.0f}s")
+        del jobs[name]
+        save_jobs()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run prompts from a JSONL file through the AI client.")
+    parser.add_argument("input", help="input JSONL, one request per line")
+    parser.add_argument("output", help="output JSONL (appended to; used for resume)")
+    parser.add_argument("--id-field", default="request_id", help="input field used as the result id")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel requests (online mode)")
+    parser.add_argument("--rate", type=float, default=1.0, help="max requests per second, 0 = unlimited")
+    parser.add_argument("--profile", default="batch", help="generation profile (see generation_profiles.py)")
+    parser.add_argument("--timeout", type=int, default=None, help="per-request timeout, overrides the profile")
+    parser.add_argument("--batch", action="store_true", help="use Gemini's batch endpoint instead")
+    parser.add_argument("--batch-size", type=int, default=100, help="prompts per batch job")
+    parser.add_argument("--poll", type=float, default=BATCH_POLL_SECONDS, help="batch status poll interval")
+    args = parser.parse_args(argv)
+
+    if not GEMINI_API_KEY:
+        print("API ERROR: GEMINI_API_KEY is not set. Check your .env file.")
+        return 1
+
+    done = completed_lines(args.output)
+    if done:
+        print(f"Resuming: {len(done)} lines already completed in {args.output}")
+    items = (item for item in read_requests(args.input, args.id_field) if item["line"] not in done)
+
+    writer = ResultWriter(args.output)
+    started = time.perf_counter()
+    try:
+        if args.batch:
+            run_batch(items, writer, args.output, args.batch_size, args.poll, args.profile)
+        else:
+            run_online(items, writer, max(1, args.concurrency), args.rate, args.timeout, args.profile)
+    except KeyboardInterrupt:
+        print("Interrupted; re-run the same command to resume.")
+        return 130
+    finally:
+        writer.close()
+
+    print(f"Wrote {writer.written} results ({writer.failed} failed) in {time.perf_counter() - started:.1f}s")
+    for name, stats in profile_stats.snapshot().items():
+        print(f"  {name}: p50 {stats['p50']}s  p95 {stats['p95']}s  avg output tokens {stats['avg_output_tokens']}")
+    return 1 if writer.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# bench_history.py
+"""
+Benchmark history for tester.py: every run is appended to a JSONL store together with
+environment metadata, then compared against a rolling baseline of earlier runs from the
+same environment.
+
+A stat regresses when it exceeds the baseline median by more than
+    max(rel * median, MAD_K * 1.4826 * MAD, abs_floor)
+so noisy metrics need a proportionally larger jump before the gate trips.
+
+    python bench_history.py        # trend tables + gate result for the latest run
+"""
+import os
+import sys
+import json
+import uuid
+import platform
+import subprocess
+from datetime import datetime
+from statistics import median
+from typing import Any, Dict, List
+
+from generation_profiles import percentile
+
+BENCH_HISTORY_PATH = os.getenv("BENCH_HISTORY_PATH", "bench_history.jsonl")
+BASELINE_RUNS = int(os.getenv("BENCH_BASELINE_RUNS", "10"))
+MIN_BASELINE_RUNS = 3
+MAD_K = 3.0
+
+# Which stats of each metric are gated, and how much slack they get.
+GATES: Dict[str, Dict[str, Any]] = {
+    "client_latency_s": {"stats": ["p50", "p95"], "rel": 0.25, "abs_floor": 0.05},
+    "lesson_open_ms": {"stats": ["p50", "p95"], "rel": 0.25, "abs_floor": 5.0},
+    "rss_after_lessons_mb": {"stats": ["max"], "rel": 0.10, "abs_floor": 2.0},
+    "rss_after_close_mb": {"stats": ["max"], "rel": 0.10, "abs_floor": 2.0},
+}
+DEFAULT_GATE = {"stats": ["p50", "p95"], "rel": 0.25, "abs_floor": 0.0}
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    return {
+        "n": len(samples),
+        "p50": round(percentile(samples, 50), 4),
+        "p95": round(percentile(samples, 95), 4),
+        "max": round(max(samples), 4),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Metadata that makes runs comparable (or not)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    try:
+        from PySide6 import __version__ as qt_version
+    except ImportError:
+        qt_version = ""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.system(),
+        "machine": platform.machine(),
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "pyside6": qt_version,
+        "commit": commit,
+        "model": os.getenv("GEMINI_MODEL", "") or "auto",
+        "cassette": os.getenv("AI_CASSETTE_MODE", "") or "live",
+    }
+
+
+def fingerprint(env: Dict[str, Any]) -> str:
+    """Runs are only compared with runs sharing this fingerprint."""
+    return "|".join(str(env.get(k, "")) for k in ("platform", "machine", "host", "cassette"))
+
+
+def make_run(metrics: Dict[str, List[float]]) -> Dict[str, Any]:
+    return {
+        "run_id": uuid.uuid4().hex[:12],
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "env": environment(),
+        "metrics": {name: summarize(samples) for name, samples in metrics.items() if samples},
+    }
+
+
+def load_history(path: str = BENCH_HISTORY_PATH) -> List[Dict[str, Any]]:
+    runs: List[Dict[str, Any]] = []
+    if not os.path.exists(path):
+        return runs
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs
+
+
+def append_run(run: Dict[str, Any], path: str = BENCH_HISTORY_PATH):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run, separators=(",", ":")) + "\n")
+
+
+def baseline_runs(run: Dict[str, Any], history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    key = fingerprint(run["env"])
+    same_env = [r for r in history if fingerprint(r["env"]) == key and r["run_id"] != run["run_id"]]
+    return same_env[-BASELINE_RUNS:]
+
+
+def compare(run: Dict[str, Any], history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Checks every gated stat of run against the rolling baseline.
+    Returns one finding per stat with status "regression", "improved", "ok" or "no baseline".
+    """
+    baseline = baseline_runs(run, history)
+    findings = []
+    for metric, stats in sorted(run["metrics"].items()):
+        gate = GATES.get(metric, DEFAULT_GATE)
+        for stat in gate["stats"]:
+            if stat not in stats:
+                continue
+            current = stats[stat]
+            values = [r["metrics"][metric][stat] for r in baseline
+                      if stat in r.get("metrics", {}).get(metric, {})]
+            finding = {"metric": metric, "stat": stat, "current": current, "baseline": None,
+                       "threshold": None, "status": "no baseline"}
+            if len(values) >= MIN_BASELINE_RUNS:
+                center = median(values)
+                mad = median(abs(v - center) for v in values)
+                threshold = max(gate["rel"] * center, MAD_K * 1.4826 * mad, gate["abs_floor"])
+                finding.update(baseline=round(center, 4), threshold=round(threshold, 4))
+                if current > center + threshold:
+                    finding["status"] = "regression"
+                elif current < center - threshold:
+                    finding["status"] = "improved"
+                else:
+                    finding["status"] = "ok"
+            findings.append(finding)
+    return findings
+
+
+def regressions(findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [f for f in findings if f["status"] == "regression"]
+
+
+# ----------------------------
+# Markdown
+# ----------------------------
+def summary_markdown(findings: List[Dict[str, Any]], baseline_count: int) -> str:
+    if not findings:
+        return "No benchmark metrics recorded.\n"
+    failed = regressions(findings)
+    verdict = f"**FAIL** – {len(failed)} regression(s)" if failed else "**PASS**"
+    md = f"{verdict} against a baseline of {baseline_count} earlier run(s) on this environment.\n\n"
+    md += "| Metric | Stat | Current | Baseline (median) | Allowed +/- | Status |\n"
+    md += "|---|---|---|---|---|---|\n"
+    for f in findings:
+        base = "–" if f["baseline"] is None else f["baseline"]
+        thr = "–" if f["threshold"] is None else f["threshold"]
+        md += f"| {f['metric']} | {f['stat']} | {f['current']} | {base} | {thr} | {f['status']} |\n"
+    return md
+
+
+def trend_markdown(run: Dict[str, Any], history: List[Dict[str, Any]], last: int = 10) -> str:
+    runs = (baseline_runs(run, history) + [run])[-last:]
+    md = ""
+    for metric in sorted(run["metrics"]):
+        stats = GATES.get(metric, DEFAULT_GATE)["stats"]
+        md += f"\n**{metric}**\n\n| Run | Date | Commit | " + " | ".join(stats) + " |\n"
+        md += "|---" * (3 + len(stats)) + "|\n"
+        for r in runs:
+            values = r["metrics"].get(metric, {})
+            cells = " | ".join(str(values.get(s, "–")) for s in stats)
+            marker = " (this run)" if r is run else ""
+            md += f"| {r['run_id']}{marker} | {r['timestamp']} | {r['env'].get('commit', '')} | {cells} |\n"
+    return md
+
+
+if __name__ == "__main__":
+    history = load_history()
+    if not history:
+        print(f"No benchmark history in {BENCH_HISTORY_PATH}. Run tester.py first.")
+        sys.exit(0)
+    latest = history[-1]
+    results = compare(latest, history[:-1])
+    print(summary_markdown(results, len(baseline_runs(latest, history[:-1]))))
+    print(trend_markdown(latest, history[:-1]))
+    sys.exit(1 if regressions(results) else 0)
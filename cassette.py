@@ -0,0 +1,146 @@
+# cassette.py
+"""
+Record/replay of AI traffic for deterministic tests and benchmarks.
+
+    AI_CASSETTE_MODE=record  python tester.py    # live calls, every exchange is saved
+    AI_CASSETTE_MODE=replay  python tester.py    # no network: answers come from the cassette
+
+Requests are matched on the API method and the exact request payload (prompt, length hint,
+generationConfig), so a changed prompt shows up as a CASSETTE MISS rather than a silent live
+call. The payload depends on the model (thinkingConfig), so while a cassette is active the
+model is never picked by the registry: it is GEMINI_MODEL if pinned, else FALLBACK_MODEL, in
+record and replay alike. Replays sleep for the recorded latency (and, for streams, the
+recorded gap before every chunk) multiplied by AI_CASSETTE_TIME_SCALE: 1.0 reproduces the
+original timing, 0 replays instantly.
+
+Cassettes are gzip'd JSON lines, one gzip member per exchange, so recording is append-only
+and a crash never corrupts earlier entries.
+"""
+import os
+import gzip
+import json
+import zlib
+import time
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CASSETTE_MODE = os.getenv("AI_CASSETTE_MODE", "").lower()  # "", "record" or "replay"
+CASSETTE_PATH = os.getenv("AI_CASSETTE_PATH", os.path.join("cassettes", "ai.cassette.gz"))
+CASSETTE_TIME_SCALE = float(os.getenv("AI_CASSETTE_TIME_SCALE", "1.0"))
+
+
+def request_key(method: str, payload: Dict[str, Any]) -> str:
+    """Stable identity of a request: API method plus canonical JSON payload."""
+    raw = json.dumps({"method": method, "payload": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _prompt_of(payload: Dict[str, Any]) -> str:
+    try:
+        return payload["contents"][0]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+class Cassette:
+    """
+    A set of recorded exchanges. Several recordings of the same request are replayed
+    in the order they were recorded (wrapping around), so repeated prompts stay deterministic.
+    """
+    def __init__(self, path: str, mode: str, time_scale: float = 1.0):
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.hits = 0
+        self.misses: List[str] = []
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            print(f"CASSETTE WARNING: {self.path} does not exist; every request will miss.")
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+        except (EOFError, gzip.BadGzipFile, zlib.error, ValueError) as e:
+            # Torn write at the end of a recording: keep every entry read before it.
+            kept = sum(len(entries) for entries in self._entries.values())
+            print(f"CASSETTE WARNING: {self.path} is damaged after {kept} entries ({e}); using those.")
+
+    # ------------------------------------------------------------------
+    def lookup(self, method: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns the next recorded entry for this request, or None (a miss) if there is none."""
+        key = request_key(method, payload)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                prompt = _prompt_of(payload)
+                self.misses.append(prompt)
+                print(f"CASSETTE MISS: no recording for {method} {prompt[:60]!r}")
+                return None
+            idx = self._cursor.get(key, 0)
+            self._cursor[key] = (idx + 1) % len(entries)
+            self.hits += 1
+            return entries[idx]
+
+    def record(self, method: str, payload: Dict[str, Any], entry: Dict[str, Any]):
+        """Appends one exchange; entry holds "result" (generate) or "chunks" (stream) plus timing."""
+        entry = {"key": request_key(method, payload), "method": method, "prompt": _prompt_of(payload)[:200], **entry}
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+
+    # ------------------------------------------------------------------
+    def replay_generate(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Replays a generateContent exchange with scaled timing. Misses and recorded errors return None."""
+        entry = self.lookup("generateContent", payload)
+        if entry is None:
+            return None
+        time.sleep(entry.get("latency", 0.0) * self.time_scale)
+        if entry["result"] is None:
+            return None
+        return dict(entry["result"], latency=entry.get("latency", 0.0) * self.time_scale)
+
+    def record_generate(self, payload: Dict[str, Any], result: Optional[Dict[str, Any]], latency: float):
+        saved = None if result is None else {"text": result["text"], "usage": result["usage"]}
+        self.record("generateContent", payload, {"latency": round(latency, 4), "result": saved})
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The process-wide cassette, or None when AI_CASSETTE_MODE is unset."""
+    global _cassette
+    if CASSETTE_MODE not in ("record", "replay"):
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_TIME_SCALE)
+        return _cassette
+
+
+def cassette_active() -> bool:
+    """True while AI traffic is recorded or replayed."""
+    return CASSETTE_MODE in ("record", "replay")
@@ -0,0 +1,291 @@
+# chat_history.py
+"""
+Per-user chat history: every question/answer pair from the dashboard and the lesson
+windows is kept in a compressed append-only log and made searchable through an
+incremental inverted index.
+
+Layout under CHAT_HISTORY_DIR/<user>/:
+    log.gz          one gzip member per exchange, so appends never rewrite earlier data
+                    and a single exchange can be decompressed from its byte offset
+    index.gz        append-only journal with one small gzip member per indexed exchange
+                    (log offset, preview, terms); postings are rebuilt from it on start and
+                    only log entries written after the last journaled one are re-read
+
+Writes and index updates run on a background thread; search() only reads the in-memory
+postings under a lock, so it stays in the low milliseconds even for years of transcripts.
+"""
+import os
+import re
+import gzip
+import json
+import time
+import zlib
+import queue
+import bisect
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from knowledge_base import tokenize
+
+CHAT_HISTORY_DIR = os.getenv("CHAT_HISTORY_DIR", "chat_history")
+# The last, still-being-typed query word matches at most this many indexed terms.
+MAX_PREFIX_TERMS = 200
+PREVIEW_CHARS = 120
+
+_SAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _read_member(f, offset: int) -> Tuple[Dict[str, Any], int]:
+    """Decompresses the single gzip member starting at offset; returns (exchange, end offset)."""
+    f.seek(offset)
+    inflater = zlib.decompressobj(wbits=31)
+    data = b""
+    while not inflater.eof:
+        chunk = f.read(16384)
+        if not chunk:
+            raise EOFError(f"truncated entry at byte {offset}")
+        data += inflater.decompress(chunk)
+    return json.loads(data), f.tell() - len(inflater.unused_data)
+
+
+def _contains(postings: List[int], entry_id: int) -> bool:
+    i = bisect.bisect_left(postings, entry_id)
+    return i < len(postings) and postings[i] == entry_id
+
+
+class ChatHistory:
+    """
+    History of one user. record() is safe to call from the GUI thread (it only queues);
+    search() and get() may be called from any thread.
+    """
+    def __init__(self, username: str, root: str = CHAT_HISTORY_DIR):
+        self.username = username
+        self.dir = os.path.join(root, _SAFE_NAME_RE.sub("_", username) or "_")
+        self.log_path = os.path.join(self.dir, "log.gz")
+        self.index_path = os.path.join(self.dir, "index.gz")
+
+        # entries[i] = [offset, timestamp, source, question preview]
+        self._entries: List[list] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._vocab: List[str] = []  # sorted, for prefix search
+        self._log_size = 0           # log bytes covered by the index
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def record(self, source: str, question: str, answer: str):
+        """Queues one exchange for the background writer."""
+        if not answer:
+            return
+        self._queue.put({"ts": datetime.now().strftime("%Y-%m-%d %H:%M"), "source": source,
+                         "q": question, "a": answer})
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Exchanges containing every query word, newest first. The last word also matches as a
+        prefix unless the query ends with a space, so results update while the user types.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        prefix_last = not query[-1:].isspace()
+        with self._lock:
+            # One group of posting lists per query word (several for a prefix)
+            groups: List[List[List[int]]] = []
+            for i, word in enumerate(words):
+                if prefix_last and i == len(words) - 1:
+                    start = bisect.bisect_left(self._vocab, word)
+                    lists = []
+                    for term in self._vocab[start:start + MAX_PREFIX_TERMS]:
+                        if not term.startswith(word):
+                            break
+                        lists.append(self._postings[term])
+                else:
+                    lists = [self._postings[word]] if word in self._postings else []
+                if not lists:
+                    return []
+                groups.append(lists)
+            groups.sort(key=lambda lists: sum(map(len, lists)))
+
+            # Walk the rarest word's postings from the newest entry and stop at limit,
+            # so common words never have to be materialized.
+            driver = groups[0]
+            ids = reversed(driver[0]) if len(driver) == 1 else sorted(set().union(*driver), reverse=True)
+            top = []
+            for entry_id in ids:
+                if all(any(_contains(lst, entry_id) for lst in lists) for lists in groups[1:]):
+                    top.append(entry_id)
+                    if len(top) >= limit:
+                        break
+            return [{"id": i, "timestamp": self._entries[i][1], "source": self._entries[i][2],
+                     "question": self._entries[i][3]} for i in top]
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        """The full exchange for a search result (read straight from its log offset)."""
+        with self._lock:
+            if not 0 <= entry_id < len(self._entries):
+                return None
+            offset = self._entries[entry_id][0]
+        try:
+            with open(self.log_path, "rb") as f:
+                return _read_member(f, offset)[0]
+        except (OSError, EOFError, ValueError, zlib.error) as e:
+            print(f"HISTORY ERROR: could not read entry {entry_id}: {e}")
+            return None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+        return self._loaded.wait(timeout)
+
+    def flush(self, timeout: float = 5.0):
+        """Waits until everything recorded so far is written and indexed."""
+        done = threading.Event()
+        self._queue.put({"_flush": done})
+        done.wait(timeout)
+
+    def close(self):
+        """Finishes queued writes and stops the background thread."""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    # ------------------------------------------------------------------
+    # Background thread
+    # ------------------------------------------------------------------
+    def _run(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self._load_index()
+        self._index_log_tail()
+        self._loaded.set()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if "_flush" in item:
+                item["_flush"].set()
+                continue
+            try:
+                self._append(item)
+            except OSError as e:
+                print(f"HISTORY ERROR: could not write to {self.log_path}: {e}")
+
+    def _append(self, item: Dict[str, Any]):
+        member = gzip.compress(json.dumps(item, ensure_ascii=False).encode("utf-8"))
+        with open(self.log_path, "ab") as f:
+            offset = f.tell()
+            f.write(member)
+        self._index_exchange(offset, offset + len(member), item)
+
+    def _index_exchange(self, offset: int, end: int, item: Dict[str, Any]):
+        """Adds one logged exchange to the index and journals it to disk."""
+        terms = sorted(set(tokenize(item["q"])) | set(tokenize(item["a"])))
+        record = [offset, end, item["ts"], item["source"], " ".join(item["q"].split())[:PREVIEW_CHARS], terms]
+        with open(self.index_path, "ab") as f:
+            f.write(gzip.compress((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")))
+        self._add(record)
+
+    def _add(self, record: list):
+        offset, end, ts, source, preview, terms = record
+        with self._lock:
+            entry_id = len(self._entries)
+            self._entries.append([offset, ts, source, preview])
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    self._postings[term] = [entry_id]
+                    bisect.insort(self._vocab, term)
+                else:
+                    postings.append(entry_id)
+            self._log_size = end
+
+    def _load_index(self):
+        """Replays the index journal into memory (postings are rebuilt, not stored)."""
+        if not os.path.exists(self.index_path):
+            return
+        entries: List[list] = []
+        postings: Dict[str, List[int]] = {}
+        log_size = 0
+        try:
+            with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    offset, end, ts, source, preview, terms = json.loads(line)
+                    if offset != log_size:
+                        raise ValueError(f"gap in index at byte {offset}")
+                    entry_id = len(entries)
+                    entries.append([offset, ts, source, preview])
+                    for term in terms:
+                        postings.setdefault(term, []).append(entry_id)
+                    log_size = end
+        except (OSError, EOFError, ValueError, zlib.error) as e:
+            # Torn or inconsistent journal: start over from the log, which is the source of truth.
+            print(f"HISTORY WARNING: rebuilding index for {self.username}: {e}")
+            os.remove(self.index_path)
+            return
+        with self._lock:
+            self._entries, self._postings = entries, postings
+            self._vocab = sorted(postings)
+            self._log_size = log_size
+
+    def _index_log_tail(self):
+        """Indexes exchanges logged after the last journaled one (or the whole log)."""
+        if not os.path.exists(self.log_path):
+            return
+        size = os.path.getsize(self.log_path)
+        if size < self._log_size:
+            # Log was replaced; the journal no longer describes it.
+            print(f"HISTORY WARNING: {self.log_path} is shorter than its index; rebuilding")
+            os.remove(self.index_path)
+            with self._lock:
+                self._entries, self._postings, self._vocab = [], {}, []
+                self._log_size = 0
+        with open(self.log_path, "rb") as f:
+            offset = self._log_size
+            while offset < size:
+                try:
+                    item, end = _read_member(f, offset)
+                except (EOFError, ValueError, zlib.error):
+                    # Torn write at the end of the log: drop it so appends stay aligned.
+                    print(f"HISTORY WARNING: truncating damaged tail of {self.log_path} at byte {offset}")
+                    with open(self.log_path, "r+b") as w:
+                        w.truncate(offset)
+                    break
+                self._index_exchange(offset, end, item)
+                offset = end
+
+
+_histories: Dict[str, ChatHistory] = {}
+_histories_lock = threading.Lock()
+
+
+def get_history(username: str) -> ChatHistory:
+    """The shared history object for a user (one background thread per user)."""
+    with _histories_lock:
+        history = _histories.get(username)
+        if history is None:
+            history = _histories[username] = ChatHistory(username)
+        return history
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("usage: python chat_history.py <username> <query>")
+        sys.exit(1)
+    history = get_history(sys.argv[1])
+    history.wait_loaded()
+    start = time.perf_counter()
+    results = history.search(" ".join(sys.argv[2:]))
+    elapsed = (time.perf_counter() - start) * 1000
+    for r in results:
+        print(f"[{r['timestamp']}] {r['source']}: {r['question']}")
+    print(f"{len(results)} result(s) from {len(history)} exchanges in {elapsed:.1f} ms")
+    history.close()
@@ -0,0 +1,532 @@
+# chat_server.py
+"""
+Headless chat server: serves the lesson and chat flows to a whole classroom from one async process.
+
+    python chat_server.py [--host 0.0.0.0] [--port 8765]
+
+Every session shares one upstream connection pool, one response cache and one rate limiter.
+Upstream slots are handed out round-robin across sessions, so a learner firing off many
+questions cannot starve the rest of the class. Identical prompts in flight at the same time
+(e.g. thirty learners opening the same lesson) are sent upstream once.
+
+HTTP
+    GET  /api/lessons
+    POST /api/sessions                           {"username"}         -> {"session_id"}
+    GET  /api/sessions/{sid}/progress
+    POST /api/sessions/{sid}/progress            {"lesson", "progress"}
+    POST /api/sessions/{sid}/lessons/{idx}/start                      -> {"reply", "challenge"}
+    POST /api/sessions/{sid}/messages            {"text", "profile", "lesson"?}  -> {"reply"}
+    GET  /api/stats
+WebSocket /ws/{sid}
+    client: {"type": "start_lesson", "lesson": idx} | {"type": "message", "text", "profile", "lesson"?}
+    server: {"type": "chunk", "text"} ... then {"type": "done", "challenge"?} or {"type": "error", "error"}
+
+The desktop app becomes a thin client of this server when CHAT_SERVER_URL is set (see remote_client.py).
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, WSMsgType, web
+
+from ai_client import GEMINI_API_KEY, build_request, model_for, model_url
+from cassette import Cassette, get_cassette
+from content_pack import pack_answer
+from generation_profiles import PROFILES, profile_stats
+from knowledge_base import prepare_prompt
+from lessons import LESSONS
+from rate_limiter import RateLimiter
+
+UPSTREAM_SLOTS = int(os.getenv("SERVER_UPSTREAM_SLOTS", "32"))
+UPSTREAM_RATE = float(os.getenv("SERVER_UPSTREAM_RATE", "10"))  # requests per second, 0 = unlimited
+MAX_PENDING_PER_SESSION = 4
+
+CACHE_SIZE = 2000
+CACHE_TTL = 3600
+SESSION_IDLE_TTL = 2 * 3600
+
+API_ERROR_TEXT = "API error – check key/network"
+
+ChunkCallback = Callable[[str], Awaitable[None]]
+
+
+class TooBusy(Exception):
+    """Raised when a session already has MAX_PENDING_PER_SESSION requests waiting."""
+
+
+class ResponseCache:
+    """LRU of finished replies keyed by (profile, prompt), shared by every session."""
+    def __init__(self, size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._items: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            self._items.pop(key, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key: Tuple[str, str], text: str):
+        self._items[key] = (time.monotonic(), text)
+        self._items.move_to_end(key)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+
+class FairScheduler:
+    """
+    Hands out a fixed number of upstream slots round-robin across sessions.
+    Each session has its own FIFO; after being served a session moves to the back of the line.
+    """
+    def __init__(self, slots: int):
+        self.free = slots
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def run(self, session_id: str, job: Callable[[], Awaitable[Any]]) -> Any:
+        queue = self._queues.setdefault(session_id, deque())
+        if len(queue) >= MAX_PENDING_PER_SESSION:
+            raise TooBusy(session_id)
+        turn = asyncio.get_running_loop().create_future()
+        queue.append(turn)
+        self._dispatch()
+        try:
+            await turn
+        except asyncio.CancelledError:
+            # Cancelled after being granted a slot: give it back.
+            if turn.done() and not turn.cancelled():
+                self._release()
+            raise
+        try:
+            return await job()
+        finally:
+            self._release()
+
+    def _release(self):
+        self.free += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.free and self._queues:
+            session_id, queue = self._queues.popitem(last=False)
+            turn = queue.popleft()
+            if queue:
+                self._queues[session_id] = queue
+            if turn.cancelled():
+                continue
+            self.free -= 1
+            turn.set_result(None)
+
+
+def _chunk_text(data: Dict[str, Any]) -> str:
+    try:
+        return "".join(part.get("text", "") for part in data["candidates"][0]["content"]["parts"])
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+class _ClientStream:
+    """Forwards chunks to one client; after its first send error it drops the rest and keeps the error."""
+    def __init__(self, on_chunk: ChunkCallback):
+        self.on_chunk = on_chunk
+        self.error: Optional[Exception] = None
+
+    async def __call__(self, text: str):
+        if self.error is not None:
+            return
+        try:
+            await self.on_chunk(text)
+        except Exception as e:
+            self.error = e
+
+
+class Backend:
+    """Shared upstream state: connection pool, response cache, rate limiter and fair scheduler."""
+    def __init__(self):
+        self.cache = ResponseCache()
+        self.scheduler = FairScheduler(UPSTREAM_SLOTS)
+        self.limiter = RateLimiter(UPSTREAM_RATE, burst=UPSTREAM_SLOTS)
+        self.coalesced = 0
+        self.packed = 0
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.http: Optional[ClientSession] = None
+
+    async def start(self):
+        self.http = ClientSession(connector=TCPConnector(limit=UPSTREAM_SLOTS, ttl_dns_cache=300))
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.close()
+
+    async def reply(self, session_id: str, prompt: str, profile: str,
+                    on_chunk: Optional[ChunkCallback] = None, lesson: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the full reply for prompt (None on upstream error).
+        When on_chunk is given, text is passed to it as it arrives.
+        lesson is the catalog title the prompt was asked in, for lesson-scoped pack answers.
+        """
+        # Pack and index lookups touch the disk (stat, re-map), so they run off the event loop
+        # like cassette writes in _call_upstream: one slow disk must not stall every session.
+        loop = asyncio.get_running_loop()
+        packed = await loop.run_in_executor(None, pack_answer, prompt, lesson)
+        if packed is not None:
+            self.packed += 1
+            return await self._deliver(packed, on_chunk)
+
+        direct, prepared = await loop.run_in_executor(None, prepare_prompt, prompt)
+        if direct is not None:
+            return await self._deliver(direct, on_chunk)
+
+        key = (profile, prepared)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return await self._deliver(cached, on_chunk)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await self._deliver(await asyncio.shield(pending), on_chunk)
+
+        result = loop.create_future()
+        self._inflight[key] = result
+        # The upstream read is shared with coalesced waiters and the cache, so this client's
+        # send errors (e.g. a closed socket) must not end it; they are re-raised once it finishes.
+        stream = _ClientStream(on_chunk) if on_chunk is not None else None
+        try:
+            text = await self.scheduler.run(session_id, lambda: self._call_upstream(prepared, profile, stream))
+        except BaseException:
+            result.set_result(None)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        result.set_result(text)
+        if text is not None:
+            self.cache.put(key, text)
+        if stream is not None and stream.error is not None:
+            raise stream.error
+        return text
+
+    @staticmethod
+    async def _deliver(text: Optional[str], on_chunk: Optional[ChunkCallback]) -> Optional[str]:
+        if text and on_chunk is not None:
+            await on_chunk(text)
+        return text
+
+    async def _call_upstream(self, prompt: str, profile: str, on_chunk: Optional[ChunkCallback]) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        tape = await loop.run_in_executor(None, get_cassette)  # the first call loads the cassette
+        replay = tape is not None and tape.replaying
+        if not GEMINI_API_KEY and not replay:
+            print("API ERROR: GEMINI_API_KEY is not set. Check your .env file.")
+            return None
+        if not prompt.strip():
+            return ""
+        model = await loop.run_in_executor(None, model_for, profile)
+        payload, timeout = build_request(prompt, profile, model)
+        method = "generateContent" if on_chunk is None else "streamGenerateContent"
+        if replay:
+            return await self._replay(tape, method, payload, on_chunk)
+
+        await asyncio.sleep(self.limiter.reserve())
+        if on_chunk is not None:
+            url = f"{model_url(model, method)}?alt=sse&key={GEMINI_API_KEY}"
+        else:
+            url = f"{model_url(model)}?key={GEMINI_API_KEY}"
+
+        start = time.perf_counter()
+        chunks = []  # [seconds since request, text] for the cassette
+        usage: Dict[str, Any] = {}
+        try:
+            async with self.http.post(url, json=payload, timeout=ClientTimeout(total=timeout)) as resp:
+                if resp.status >= 400:
+                    body = await resp.text()
+                    raise ClientError(f"Status Code: {resp.status}. Response Text: {body[:150]}...")
+                if on_chunk is None:
+                    data = await resp.json()
+                    chunks.append([time.perf_counter() - start, _chunk_text(data)])
+                    usage = data.get("usageMetadata", {})
+                else:
+                    async for raw in resp.content:
+                        line = raw.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        data = json.loads(line[5:])
+                        usage = data.get("usageMetadata", usage)
+                        piece = _chunk_text(data)
+                        if piece:
+                            chunks.append([round(time.perf_counter() - start, 4), piece])
+                            await on_chunk(piece)
+        except (ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"API CONNECTION/REQUEST ERROR: {type(e).__name__}: {e}")
+            profile_stats.record(profile, 0.0, False)
+            if tape is not None:
+                await loop.run_in_executor(None, tape.record, method, payload,
+                                           {"latency": round(time.perf_counter() - start, 4),
+                                            "result": None, "chunks": None})
+            return None
+
+        latency = time.perf_counter() - start
+        text = "".join(piece for _t, piece in chunks).strip()
+        if not text:
+            # Blocked, or cut off (MAX_TOKENS) before any text: an error, not an empty answer.
+            print("API ERROR: response has no text")
+            profile_stats.record(profile, latency, False)
+            if tape is not None:
+                await loop.run_in_executor(None, tape.record, method, payload,
+                                           {"latency": round(latency, 4), "result": None, "chunks": None})
+            return None
+        profile_stats.record(profile, latency, True, usage.get("candidatesTokenCount", 0))
+        if tape is not None:
+            if on_chunk is None:
+                entry = {"latency": round(latency, 4), "result": {"text": text, "usage": usage}}
+            else:
+                entry = {"latency": round(latency, 4), "chunks": chunks, "usage": usage}
+            await loop.run_in_executor(None, tape.record, method, payload, entry)
+        return text
+
+    @staticmethod
+    async def _replay(tape: Cassette, method: str, payload: Dict[str, Any],
+                      on_chunk: Optional[ChunkCallback]) -> Optional[str]:
+        """Serves a recorded exchange, reproducing its (scaled) latency and chunk timing."""
+        entry = tape.lookup(method, payload)
+        if entry is None:
+            return None
+        if on_chunk is None:
+            await asyncio.sleep(entry.get("latency", 0.0) * tape.time_scale)
+            return entry["result"]["text"] if entry.get("result") else None
+        if entry.get("chunks") is None:
+            await asyncio.sleep(entry.get("latency", 0.0) * tape.time_scale)
+            return None
+        start = time.perf_counter()
+        for offset, piece in entry["chunks"]:
+            await asyncio.sleep(max(0.0, offset * tape.time_scale - (time.perf_counter() - start)))
+            await on_chunk(piece)
+        return "".join(piece for _t, piece in entry["chunks"]).strip()
+
+
+class Sessions:
+    """In-memory learner sessions with per-session lesson progress."""
+    def __init__(self):
+        self._items: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def create(self, username: str) -> str:
+        session_id = uuid.uuid4().hex
+        self._items[session_id] = {
+            "username": username,
+            "progress": [lesson["progress"] for lesson in LESSONS],
+            "last_seen": time.monotonic(),
+        }
+        return session_id
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self._items.get(session_id)
+        if session is not None:
+            session["last_seen"] = time.monotonic()
+        return session
+
+    def expire_idle(self):
+        cutoff = time.monotonic() - SESSION_IDLE_TTL
+        for session_id in [s for s, v in self._items.items() if v["last_seen"] < cutoff]:
+            del self._items[session_id]
+
+
+# ----------------------------
+# HTTP / WebSocket handlers
+# ----------------------------
+def _session_or_404(request: web.Request) -> Tuple[str, Dict[str, Any]]:
+    session_id = request.match_info["sid"]
+    session = request.app["sessions"].get(session_id)
+    if session is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": "unknown session"}), content_type="application/json")
+    return session_id, session
+
+
+def _lesson_at(idx: Any) -> Dict[str, Any]:
+    """LESSONS[idx] for a non-negative index; raises IndexError/ValueError/TypeError otherwise."""
+    idx = int(idx)
+    if idx < 0:  # LESSONS[-1] would silently start the last lesson
+        raise IndexError(idx)
+    return LESSONS[idx]
+
+
+def _lesson_or_404(idx: Any) -> Dict[str, Any]:
+    try:
+        return _lesson_at(idx)
+    except (ValueError, TypeError, IndexError):
+        raise web.HTTPNotFound(text=json.dumps({"error": "unknown lesson"}), content_type="application/json")
+
+
+def _profile(name: Any, default: str) -> str:
+    return name if name in PROFILES else default
+
+
+async def _json_body(request: web.Request) -> Dict[str, Any]:
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    return data if isinstance(data, dict) else {}
+
+
+async def list_lessons(request: web.Request) -> web.Response:
+    return web.json_response(LESSONS)
+
+
+async def create_session(request: web.Request) -> web.Response:
+    data = await _json_body(request)
+    session_id = request.app["sessions"].create(str(data.get("username", "learner")))
+    return web.json_response({"session_id": session_id})
+
+
+async def get_progress(request: web.Request) -> web.Response:
+    _sid, session = _session_or_404(request)
+    return web.json_response({"progress": session["progress"]})
+
+
+async def set_progress(request: web.Request) -> web.Response:
+    _sid, session = _session_or_404(request)
+    data = await _json_body(request)
+    _lesson_or_404(data.get("lesson"))
+    try:
+        session["progress"][int(data["lesson"])] = max(0.0, min(1.0, float(data.get("progress", 0.0))))
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "progress must be a number"}), content_type="application/json")
+    return web.json_response({"progress": session["progress"]})
+
+
+async def _reply_response(request: web.Request, session_id: str, prompt: str, profile: str,
+                          extra: Optional[Dict[str, Any]] = None, lesson: Optional[str] = None) -> web.Response:
+    try:
+        text = await request.app["backend"].reply(session_id, prompt, profile, lesson=lesson)
+    except TooBusy:
+        return web.json_response({"error": "too many pending requests"}, status=429)
+    if text is None:
+        return web.json_response({"error": API_ERROR_TEXT}, status=502)
+    return web.json_response({"reply": text, **(extra or {})})
+
+
+async def start_lesson(request: web.Request) -> web.Response:
+    session_id, _session = _session_or_404(request)
+    lesson = _lesson_or_404(request.match_info["idx"])
+    return await _reply_response(request, session_id, lesson["start_prompt"], "lesson_intro",
+                                 {"challenge": lesson.get("challenge", "")})
+
+
+async def send_message(request: web.Request) -> web.Response:
+    session_id, _session = _session_or_404(request)
+    data = await _json_body(request)
+    lesson = data.get("lesson")
+    return await _reply_response(request, session_id, str(data.get("text", "")),
+                                 _profile(data.get("profile"), "quick_chat"),
+                                 lesson=lesson if isinstance(lesson, str) else None)
+
+
+async def stats(request: web.Request) -> web.Response:
+    backend: Backend = request.app["backend"]
+    return web.json_response({
+        "sessions": len(request.app["sessions"]),
+        "profiles": profile_stats.snapshot(),
+        "cache": {"hits": backend.cache.hits, "misses": backend.cache.misses, "coalesced": backend.coalesced,
+                  "content_pack": backend.packed},
+        "upstream": {"free_slots": backend.scheduler.free, "waiting": backend.scheduler.waiting},
+    })
+
+
+async def chat_socket(request: web.Request) -> web.WebSocketResponse:
+    session_id, _session = _session_or_404(request)
+    backend: Backend = request.app["backend"]
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    async def send_chunk(text: str):
+        await ws.send_json({"type": "chunk", "text": text})
+
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        try:
+            data = json.loads(msg.data)
+            scope = None
+            if data.get("type") == "start_lesson":
+                lesson = _lesson_at(data.get("lesson"))
+                prompt, profile, done = lesson["start_prompt"], "lesson_intro", {"challenge": lesson.get("challenge", "")}
+            elif data.get("type") == "message":
+                prompt, profile, done = str(data.get("text", "")), _profile(data.get("profile"), "quick_chat"), {}
+                scope = data.get("lesson") if isinstance(data.get("lesson"), str) else None
+            else:
+                await ws.send_json({"type": "error", "error": "unknown message type"})
+                continue
+        except (ValueError, TypeError, IndexError, AttributeError):
+            await ws.send_json({"type": "error", "error": "bad request"})
+            continue
+
+        try:
+            text = await backend.reply(session_id, prompt, profile, on_chunk=send_chunk, lesson=scope)
+        except TooBusy:
+            await ws.send_json({"type": "error", "error": "too many pending requests"})
+            continue
+        except ConnectionResetError:
+            break
+        if text is None:
+            await ws.send_json({"type": "error", "error": API_ERROR_TEXT})
+        else:
+            await ws.send_json({"type": "done", **done})
+    return ws
+
+
+async def _backend_context(app: web.Application):
+    await app["backend"].start()
+
+    async def expire_sessions():
+        while True:
+            await asyncio.sleep(60)
+            app["sessions"].expire_idle()
+
+    expiry = asyncio.create_task(expire_sessions())
+    yield
+    expiry.cancel()
+    await app["backend"].close()
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app["backend"] = Backend()
+    app["sessions"] = Sessions()
+    app.cleanup_ctx.append(_backend_context)
+    app.add_routes([
+        web.get("/api/lessons", list_lessons),
+        web.post("/api/sessions", create_session),
+        web.get("/api/sessions/{sid}/progress", get_progress),
+        web.post("/api/sessions/{sid}/progress", set_progress),
+        web.post("/api/sessions/{sid}/lessons/{idx}/start", start_lesson),
+        web.post("/api/sessions/{sid}/messages", send_message),
+        web.get("/api/stats", stats),
+        web.get("/ws/{sid}", chat_socket),
+    ])
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the lesson and chat flows over HTTP/WebSocket.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
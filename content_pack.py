@@ -0,0 +1,324 @@
+# content_pack.py
+"""
+Precompiled lesson content for labs with little or no network.
+
+Every lesson intro, challenge explanation and common lesson question is generated once
+from the lesson catalog into a versioned binary pack, which is memory-mapped at runtime:
+
+    python content_pack.py build [pack_path]      # needs the API (or a cassette replay)
+    python content_pack.py info  [pack_path]
+    python content_pack.py lookup "give me a hint" [--lesson "Input Validation"]
+
+Lookups binary-search a hash-sorted entry table and compare keys in place, so the file
+is never parsed as a whole and only the returned answer is decoded.
+
+The pack is swapped without a restart, on Windows too (where a memory-mapped file cannot be
+replaced or deleted): every build writes a new file, <pack_path>.<pack version>, and then
+replaces the small pointer file <pack_path>, which holds that file's name. Readers re-open
+the pack when the pointer changes (checked at most every CONTENT_PACK_CHECK_SECONDS).
+Superseded pack files are deleted by the next build once no process maps them any more.
+"""
+import os
+import re
+import sys
+import mmap
+import time
+import struct
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from lessons import LESSONS
+
+load_dotenv()
+
+CONTENT_PACK_PATH = os.getenv("CONTENT_PACK_PATH", "lessons.pack")
+CONTENT_PACK_CHECK_SECONDS = 2.0
+
+# Scripted questions answered from the pack inside a lesson window.
+# "asks" are what learners type (matched after normalize()); "prompt" is sent at build time.
+COMMON_QUESTIONS: List[Dict[str, object]] = [
+    {"asks": ["explain the challenge", "explain challenge", "what is the challenge",
+              "i dont understand the challenge", "what does the challenge mean"],
+     "prompt": "Explain this secure-coding challenge from a lesson on {title} in plain words: what is asked, "
+               "what a good solution must handle and which security mistakes to avoid. "
+               "Do not give the full solution.\n\nChallenge: {challenge}"},
+    {"asks": ["hint", "give me a hint", "i need a hint", "can i have a hint"],
+     "prompt": "Give one short hint for this challenge from a lesson on {title}, without the solution.\n\n"
+               "Challenge: {challenge}"},
+    {"asks": ["example", "show an example", "show me an example", "give me an example"],
+     "prompt": "Show one short, secure code example that illustrates {title}."},
+    {"asks": ["common mistakes", "what are common mistakes", "what are the common mistakes", "what should i avoid"],
+     "prompt": "List the most common security mistakes developers make with {title}, one line each."},
+    {"asks": ["why does this matter", "why is this important", "why does it matter"],
+     "prompt": "In a few sentences, explain why {title} matters, with one real-world attack as an example."},
+]
+
+# ----------------------------
+# On-disk layout (little endian, all offsets absolute)
+#   header  : magic, format version, pack version, built_at (unix time), n_entries, entries_off
+#   entries : sorted by key hash -> hash, key_off, key_len, text_off, text_len
+#   blobs   : UTF-8 keys and answer texts (aliases share one text)
+# ----------------------------
+MAGIC = b"SCCP"
+VERSION = 1
+HEADER = struct.Struct("<4sIIQIQ")
+ENTRY = struct.Struct("<QQHQI")
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase words separated by single spaces, so punctuation and spacing don't matter."""
+    return _NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+def make_key(prompt: str, lesson: Optional[str] = None) -> bytes:
+    """Pack key for a prompt, optionally scoped to a lesson title."""
+    scope = normalize(lesson) if lesson else ""
+    return f"{scope}\x00{normalize(prompt)}".encode("utf-8")
+
+
+def _key_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+# ----------------------------
+# Build
+# ----------------------------
+def pack_items(lessons: List[Dict[str, object]] = LESSONS) -> List[Tuple[List[bytes], str, str]]:
+    """Everything a pack contains: (keys, prompt to generate, profile) per answer."""
+    items: List[Tuple[List[bytes], str, str]] = []
+    for lesson in lessons:
+        title, challenge = str(lesson["title"]), str(lesson.get("challenge", ""))
+        start = str(lesson.get("start_prompt", ""))
+        if start:
+            # Start prompts are unique, so they are looked up without a lesson scope.
+            items.append(([make_key(start)], start, "lesson_intro"))
+        for question in COMMON_QUESTIONS:
+            if "{challenge}" in question["prompt"] and not challenge:
+                continue
+            keys = [make_key(ask, title) for ask in question["asks"]]
+            items.append((keys, question["prompt"].format(title=title, challenge=challenge), "grading"))
+    return items
+
+
+def write_pack(answers: List[Tuple[List[bytes], str]], pack_path: str, pack_version: int) -> int:
+    """Writes (keys, text) pairs as a pack. Returns the number of entries (keys)."""
+    entries: List[Tuple[int, bytes, int, int]] = []  # (hash, key, text_off, text_len) with text_off relative
+    texts = bytearray()
+    for keys, text in answers:
+        raw = text.encode("utf-8")
+        text_off = len(texts)
+        texts += raw
+        for key in keys:
+            entries.append((_key_hash(key), key, text_off, len(raw)))
+    entries.sort(key=lambda e: (e[0], e[1]))
+
+    entries_off = HEADER.size
+    keys_off = entries_off + ENTRY.size * len(entries)
+    keys_blob = bytearray()
+    table = bytearray()
+    texts_off = keys_off + sum(len(e[1]) for e in entries)
+    for key_hash, key, text_off, text_len in entries:
+        table += ENTRY.pack(key_hash, keys_off + len(keys_blob), len(key), texts_off + text_off, text_len)
+        keys_blob += key
+
+    # A new file per version: running apps keep mapping the old one until they switch.
+    data_path = f"{pack_path}.{pack_version}"
+    with open(data_path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, pack_version, int(time.time()), len(entries), entries_off))
+        f.write(table)
+        f.write(keys_blob)
+        f.write(texts)
+    os.replace(data_path + ".tmp", data_path)
+    with open(pack_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(data_path) + "\n")
+    os.replace(pack_path + ".tmp", pack_path)  # atomic: running apps pick up the new pack on their next check
+    _remove_old_packs(pack_path, data_path)
+    return len(entries)
+
+
+def _remove_old_packs(pack_path: str, current: str):
+    """Deletes superseded pack files; ones still mapped somewhere (Windows) are left for the next build."""
+    folder = os.path.dirname(pack_path) or "."
+    prefix = os.path.basename(pack_path) + "."
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name[len(prefix):].isdigit() and name != os.path.basename(current):
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+
+
+def resolve_pack_path(pack_path: str) -> str:
+    """The pack file a pointer file names, or pack_path itself if it is a pack file."""
+    with open(pack_path, "rb") as f:
+        head = f.read(256)
+    if head.startswith(MAGIC):
+        return pack_path
+    return os.path.join(os.path.dirname(pack_path), head.decode("utf-8").strip())
+
+
+def build_pack(pack_path: str = CONTENT_PACK_PATH) -> int:
+    """Generates every pack item through ai_client and writes the pack. Returns the entry count."""
+    from ai_client import generate  # only the build needs the API client
+
+    previous = 0
+    if os.path.exists(pack_path):
+        try:
+            previous = ContentPack(pack_path).pack_version
+        except (OSError, ValueError, struct.error):
+            pass
+
+    answers: List[Tuple[List[bytes], str]] = []
+    items = pack_items()
+    for n, (keys, prompt, profile) in enumerate(items, 1):
+        result = generate(prompt, profile=profile)
+        if result is None or not result["text"]:
+            print(f"PACK WARNING: no answer for {prompt[:60]!r}; it will be served live")
+            continue
+        answers.append((keys, result["text"]))
+        print(f"[{n}/{len(items)}] {prompt[:70]!r}")
+    if not answers:
+        print("PACK ERROR: nothing was generated; keeping the existing pack")
+        return 0
+    return write_pack(answers, pack_path, previous + 1)
+
+
+# ----------------------------
+# Read
+# ----------------------------
+class ContentPack:
+    """
+    Read-only view over a memory-mapped content pack.
+    Safe to share between threads: lookups only read the mapping.
+    """
+    def __init__(self, pack_path: str = CONTENT_PACK_PATH):
+        self.path = resolve_pack_path(pack_path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.pack_version, self.built_at,
+             self.n_entries, self._entries_off) = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{pack_path} is not a content pack (v{VERSION})")
+            self._validate()
+        except (ValueError, struct.error):
+            self._mm.close()
+            raise
+
+    def _validate(self):
+        """Checks every entry points inside the file, so lookups never read out of bounds."""
+        size = len(self._mm)
+        if self._entries_off + self.n_entries * ENTRY.size > size:
+            raise ValueError(f"{self.path}: entry table runs past the end of the file")
+        for _hash, key_off, key_len, text_off, text_len in ENTRY.iter_unpack(
+                self._mm[self._entries_off:self._entries_off + self.n_entries * ENTRY.size]):
+            if key_off + key_len > size or text_off + text_len > size:
+                raise ValueError(f"{self.path}: entry points past the end of the file (truncated pack?)")
+
+    def _get(self, key: bytes) -> Optional[str]:
+        key_hash = _key_hash(key)
+        lo, hi = 0, self.n_entries
+        while lo < hi:  # leftmost entry with this hash
+            mid = (lo + hi) // 2
+            if ENTRY.unpack_from(self._mm, self._entries_off + mid * ENTRY.size)[0] < key_hash:
+                lo = mid + 1
+            else:
+                hi = mid
+        view = memoryview(self._mm)
+        try:
+            for i in range(lo, self.n_entries):
+                h, key_off, key_len, text_off, text_len = ENTRY.unpack_from(self._mm, self._entries_off + i * ENTRY.size)
+                if h != key_hash:
+                    break
+                if view[key_off:key_off + key_len] == key:
+                    return str(view[text_off:text_off + text_len], "utf-8")
+        finally:
+            view.release()
+        return None
+
+    def lookup(self, prompt: str, lesson: Optional[str] = None) -> Optional[str]:
+        """The packed answer for prompt (lesson-scoped first), or None if it is not scripted."""
+        if lesson:
+            answer = self._get(make_key(prompt, lesson))
+            if answer is not None:
+                return answer
+        return self._get(make_key(prompt))
+
+
+# ----------------------------
+# Shared, hot-swappable instance
+# ----------------------------
+_pack: Optional[ContentPack] = None
+_pack_identity: Optional[Tuple[int, int, int]] = None  # pointer file the current state was read from
+_pack_checked = 0.0
+_pack_lock = threading.Lock()
+
+
+def get_content_pack() -> Optional[ContentPack]:
+    """
+    The current pack, re-opened when the pointer file on disk has been replaced.
+    A replaced mapping is not closed here; it is released once no lookup uses it.
+    A pack that fails to open is reported once and not retried until it is replaced.
+    """
+    global _pack, _pack_identity, _pack_checked
+    with _pack_lock:
+        now = time.monotonic()
+        if _pack_checked and now - _pack_checked < CONTENT_PACK_CHECK_SECONDS:
+            return _pack
+        _pack_checked = now
+        try:
+            st = os.stat(CONTENT_PACK_PATH)
+        except OSError:
+            _pack, _pack_identity = None, None
+            return None
+        identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if identity != _pack_identity:
+            _pack_identity = identity
+            try:
+                _pack = ContentPack(CONTENT_PACK_PATH)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"PACK ERROR: could not open {CONTENT_PACK_PATH}: {e}")
+                _pack = None
+        return _pack
+
+
+def pack_answer(prompt: str, lesson: Optional[str] = None) -> Optional[str]:
+    """Scripted answer for prompt from the content pack, or None when the API is needed."""
+    pack = get_content_pack()
+    if pack is None or not prompt.strip():
+        return None
+    try:
+        return pack.lookup(prompt, lesson)
+    except UnicodeDecodeError as e:  # a damaged answer is served live instead
+        print(f"PACK ERROR: bad entry in {pack.path}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        out = sys.argv[2] if len(sys.argv) > 2 else CONTENT_PACK_PATH
+        count = build_pack(out)
+        if not count:
+            sys.exit(1)
+        print(f"Wrote {count} entries to {out}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "info":
+        path = sys.argv[2] if len(sys.argv) > 2 else CONTENT_PACK_PATH
+        pack = ContentPack(path)
+        built = datetime.fromtimestamp(pack.built_at).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{path}: pack version {pack.pack_version}, built {built}, {pack.n_entries} entries")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "lookup":
+        args = sys.argv[2:]
+        lesson = None
+        if "--lesson" in args:
+            i = args.index("--lesson")
+            lesson = args[i + 1] if i + 1 < len(args) else None
+            args = args[:i] + args[i + 2:]
+        answer = pack_answer(" ".join(args), lesson)
+        print(answer if answer is not None else "(not in pack)")
+    else:
+        print(__doc__)
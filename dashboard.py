@@ -1,13 +1,21 @@
+import copy
 import threading
 from typing import Optional
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
-    QFrame, QTextEdit, QApplication, QScrollBar
+    QFrame, QTextEdit, QApplication, QLineEdit, QListWidget, QListWidgetItem
 )
-from PySide6.QtGui import QMovie, QPainter, QPen, QBrush, QColor, QTextCursor 
-from PySide6.QtCore import Qt, QEvent, QTimer, QThreadPool
+from PySide6.QtGui import QPainter, QPen, QBrush, QColor
+from PySide6.QtCore import Qt, QEvent, QTimer
 
 from ai_worker import AIWorker 
+from chat_history import get_history
+from lesson_window import LessonWindowRegistry
+from render_scheduler import RenderScheduler
+from spinner import Spinner
+from lessons import LESSONS
+import remote_client
+from remote_client import CHAT_SERVER_URL
 
 class ProgressCircle(QWidget):
     def __init__(self, progress: float = 0.0):
@@ -32,31 +40,22 @@ class ProgressCircle(QWidget):
             painter.drawArc(center.x()-radius, center.y()-radius,
                             radius*2, radius*2, start_angle, span_angle)
 
+# Search runs this long after the last keystroke in the history search box.
+SEARCH_DEBOUNCE_MS = 120
+
 class DashboardWindow(QWidget):
-    def __init__(self):
+    def __init__(self, username: str = "learner"):
         super().__init__()
+        self.username = username or "learner"
+        # Every exchange (here and in lesson windows) is kept in the user's searchable history
+        self.history = get_history(self.username)
+
+        # Thin clients take the catalog from the shared server when it is reachable.
+        self.lessons = (CHAT_SERVER_URL and remote_client.get_lessons()) or copy.deepcopy(LESSONS)
 
-        self.lessons = [
-            {"title": "Input Validation",
-             "start_prompt": "Give a short intro to input validation: what it is, why it matters, and a tiny Flask example.",
-             "challenge": "Flask /login route: username alnum 3-20 chars, password min 8 chars w/ uppercase+digit. Return JSON status.",
-             "progress": 1.0},
-            {"title": "Auth & Sessions",
-             "start_prompt": "Briefly explain authentication and session management: hashing (bcrypt), secure cookies, session fixation.",
-             "challenge": "Implement secure Flask login: bcrypt hash, secure HttpOnly SameSite cookie, return JWT.",
-             "progress": 0.5},
-            {"title": "Access Control",
-             "start_prompt": "Explain RBAC vs ABAC and why permission checks must happen on every request.",
-             "challenge": "Write a Flask decorator @require_role('admin') and protect /users endpoint; others get 403.",
-             "progress": 0.25},
-            {"title": "Error Handling",
-             "start_prompt": "Explain secure error handling: don't expose stack traces, log safely, return a generic message.",
-             "challenge": "Add global Flask 500 handler which logs exception and returns a safe JSON message.",
-             "progress": 0.0}
-        ]
-
-        self.threadpool = QThreadPool()
         self._current_worker = None
+        # One window per lesson, reused when the lesson is clicked again
+        self.lesson_windows = LessonWindowRegistry(history=self.history)
         self.last_opened_lesson_idx: Optional[int] = None  # Remember last lesson opened
 
         self.init_ui()
@@ -152,23 +151,33 @@ class DashboardWindow(QWidget):
         rtitle.setStyleSheet("color:white; font-size:16px; font-weight:bold; margin:6px;")
         right_layout.addWidget(rtitle)
 
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search past answers…")
+        self.search_input.setStyleSheet("background:white; color:#0b3d91; border-radius:8px; padding:6px;")
+        self.search_input.textChanged.connect(lambda _text: self._search_timer.start())
+        right_layout.addWidget(self.search_input)
+
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self._run_history_search)
+
+        # Results replace the chat view while a search is active
+        self.search_results = QListWidget()
+        self.search_results.setFixedHeight(360)
+        self.search_results.setStyleSheet("background:white; color:#0b3d91; border-radius:8px; padding:4px;")
+        self.search_results.itemActivated.connect(self._open_history_entry)
+        self.search_results.itemClicked.connect(self._open_history_entry)
+        self.search_results.hide()
+        right_layout.addWidget(self.search_results)
+
         self.chat_display = QTextEdit()
         self.chat_display.setReadOnly(True)
         self.chat_display.setFixedHeight(360)
         self.chat_display.setStyleSheet("background:white; color:#0b3d91; border-radius:8px; padding:8px;")
         right_layout.addWidget(self.chat_display)
 
-        self.spinner = QLabel()
-        self.spinner.setAlignment(Qt.AlignCenter)
-        try:
-            movie = QMovie("spinner.gif")
-            if movie.isValid():
-                self.spinner.setMovie(movie)
-                movie.start()
-            else:
-                raise Exception()
-        except Exception:
-            self.spinner.setText("<b style='color:white'>AI is generating...</b>")
+        self.spinner = Spinner()
         self.spinner.hide()
         right_layout.addWidget(self.spinner)
 
@@ -200,13 +209,14 @@ class DashboardWindow(QWidget):
         self.spinner.show()
         QApplication.processEvents()
 
-        worker = AIWorker(text)
-        worker.signals.finished.connect(self._display_quick_reply)
-        worker.signals.error.connect(lambda r: self._display_quick_reply(r))
+        worker = AIWorker(text, profile="quick_chat")
+        # The question travels with its worker, so overlapping sends record the right pair
+        worker.signals.finished.connect(lambda r, q=text: self._display_quick_reply(r, q))
+        worker.signals.error.connect(lambda r, q=text: self._display_quick_reply(r, q))
         self._current_worker = worker
         worker.run()
 
-    def _display_quick_reply(self, reply_text: Optional[str]):
+    def _display_quick_reply(self, reply_text: Optional[str], question: str = ""):
         if self._current_worker:
             del self._current_worker
             self._current_worker = None
@@ -217,35 +227,60 @@ class DashboardWindow(QWidget):
             return
         if not reply_text:
             reply_text = "(no response)"
-
-        chunk = 35
-        idx = 0
-        vertical_scroll_bar: QScrollBar = self.chat_display.verticalScrollBar()
-
-        def step():
-            nonlocal idx
-            if idx >= len(reply_text):
-                self.chat_display.append("\n")
-                return
-            end = min(idx + chunk, len(reply_text))
-            piece = reply_text[idx:end]
-            cur = self.chat_display.textCursor()
-            cur.movePosition(QTextCursor.MoveOperation.End) 
-            cur.insertText(piece)
-            vertical_scroll_bar.setValue(vertical_scroll_bar.maximum())
-            idx = end
-            QTimer.singleShot(25, step)
-
-        QTimer.singleShot(0, step)
+        else:
+            self.history.record("Quick chat", question, reply_text)
+
+        # Typed out by the app-wide scheduler shared with the lesson windows
+        RenderScheduler.instance().enqueue(self.chat_display, reply_text,
+                                           on_done=lambda: self.chat_display.append("\n"))
+
+    # -------------------- HISTORY SEARCH --------------------
+    def _run_history_search(self):
+        query = self.search_input.text()
+        self.search_results.clear()
+        if not query.strip():
+            self.search_results.hide()
+            self.chat_display.show()
+            return
+        results = self.history.search(query)
+        if not results:
+            self.search_results.addItem("No matching answers")
+        for r in results:
+            item = QListWidgetItem(f"{r['timestamp']}  ·  {r['source']}\n{r['question']}")
+            item.setData(Qt.UserRole, r["id"])
+            self.search_results.addItem(item)
+        self.chat_display.hide()
+        self.search_results.show()
+
+    def _open_history_entry(self, item: QListWidgetItem):
+        entry_id = item.data(Qt.UserRole)
+        if entry_id is None:
+            return
+        entry = self.history.get(entry_id)
+        self.search_input.blockSignals(True)
+        self.search_input.clear()
+        self.search_input.blockSignals(False)
+        self.search_results.hide()
+        self.chat_display.show()
+        if entry is None:
+            self.chat_display.append("<i style='color:red'>Could not load this answer from history</i>")
+            return
+        self.chat_display.append(f"<i>From history – {entry['ts']}, {entry['source']}</i>")
+        self.chat_display.append(f"<b>You:</b> {entry['q']}\n")
+        self.chat_display.append("<b>AI:</b> ")
+        # Past answers are shown at once, through the same plain-text path as live replies
+        scheduler = RenderScheduler.instance()
+        scheduler.enqueue(self.chat_display, entry["a"], on_done=lambda: self.chat_display.append("\n"))
+        scheduler.flush(self.chat_display)
 
     # -------------------- LESSON WINDOWS --------------------
     def open_lesson_window(self, idx, custom_title: str = None):
-        from lesson_window import LessonWindow
         lesson = self.lessons[idx].copy()
+        lesson["catalog_title"] = lesson["title"]  # content pack answers are keyed by catalog title
         if custom_title:
             lesson["title"] = custom_title
-        win = LessonWindow(lesson)
-        win.show()
+        # Reuses/raises the lesson's window if it is already open
+        self.lesson_windows.open(idx, lesson)
         self.last_opened_lesson_idx = idx  # Remember last opened lesson
 
     def continue_learning(self):
@@ -0,0 +1,194 @@
+# generation_profiles.py
+"""
+Named generation profiles, one per UI surface, plus rolling latency stats per profile.
+
+A profile bounds how much the model may write (and therefore how long a reply takes):
+    max_output_tokens / temperature / stop_sequences -> sent as generationConfig
+    thinking_budget                                  -> thinkingConfig, on models that think
+    length_hint                                      -> appended to the prompt
+    timeout                                          -> per-request timeout in seconds
+"""
+import os
+import re
+import json
+import math
+import atexit
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_PROFILE = "default"
+# gemini-2.5-pro only runs in thinking mode; this is the smallest budget it accepts.
+PRO_MIN_THINKING_BUDGET = 128
+
+_MODEL_VERSION_RE = re.compile(r"gemini-(\d+)\.(\d+)")
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # No generationConfig at all: the model's own defaults (used by tester.py / test_ai.py).
+    "default": {"timeout": 30},
+    # 320px dashboard chatbox: a few sentences, fast.
+    "quick_chat": {
+        "max_output_tokens": 256,
+        "temperature": 0.4,
+        "length_hint": "Answer in at most 3 short sentences.",
+        # Thinking tokens count against maxOutputTokens; 256 would leave no room for the answer.
+        "thinking_budget": 0,
+        "timeout": 15,
+    },
+    # First message of a lesson window: short explanation plus one small example.
+    "lesson_intro": {
+        "max_output_tokens": 700,
+        "temperature": 0.6,
+        "length_hint": "Keep it under 200 words with at most one short code example.",
+        "thinking_budget": 0,
+        "timeout": 30,
+    },
+    # Learner replies inside a lesson (usually challenge attempts).
+    "grading": {
+        "max_output_tokens": 500,
+        "temperature": 0.2,
+        "length_hint": "Start with a one-line verdict, then at most 5 bullet points.",
+        "thinking_budget": 0,
+        "timeout": 25,
+    },
+    # Offline content generation through batch_runner.py.
+    "batch": {
+        "max_output_tokens": 2048,
+        "temperature": 0.7,
+        "timeout": 120,
+    },
+    # Latency probes sent by model_registry.py.
+    "probe": {
+        "max_output_tokens": 16,
+        "temperature": 0.0,
+        "thinking_budget": 0,
+        # The probe prompt asks for one word; anything after the first line is wasted time.
+        "stop_sequences": ["\n"],
+        "timeout": 20,
+    },
+}
+
+
+def get_profile(name: Optional[str]) -> Dict[str, Any]:
+    """Returns the named profile, falling back to the default one for unknown names."""
+    if name not in PROFILES:
+        if name is not None:
+            print(f"PROFILE WARNING: unknown profile {name!r}, using {DEFAULT_PROFILE!r}")
+        name = DEFAULT_PROFILE
+    return PROFILES[name]
+
+
+def model_version(model: str) -> Tuple[int, int]:
+    """(major, minor) parsed from a model name like gemini-2.5-flash; (0, 0) for aliases."""
+    match = _MODEL_VERSION_RE.search(model)
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+
+def thinking_budget(profile: Dict[str, Any], model: Optional[str]) -> Optional[int]:
+    """
+    The thinkingBudget to send for profile on model, or None to send no thinkingConfig
+    (no budget in the profile, no model, not a Gemini model, or one from before thinking, < 2.5).
+    Versionless aliases such as gemini-flash-latest track current (thinking) models, so they
+    get the budget too. Pro models cannot turn thinking off and get their minimum instead.
+    """
+    if "thinking_budget" not in profile or not model or not model.startswith("gemini"):
+        return None
+    version = model_version(model)
+    if version != (0, 0) and version < (2, 5):
+        return None
+    if "pro" in model:
+        return max(profile["thinking_budget"], PRO_MIN_THINKING_BUDGET)
+    return profile["thinking_budget"]
+
+
+def generation_config(profile: Dict[str, Any], model: Optional[str] = None) -> Dict[str, Any]:
+    """Builds the Gemini generationConfig for a profile (empty dict means 'send none')."""
+    config: Dict[str, Any] = {}
+    if "max_output_tokens" in profile:
+        config["maxOutputTokens"] = profile["max_output_tokens"]
+    if "temperature" in profile:
+        config["temperature"] = profile["temperature"]
+    if profile.get("stop_sequences"):
+        config["stopSequences"] = profile["stop_sequences"]
+    budget = thinking_budget(profile, model)
+    if budget is not None:
+        config["thinkingConfig"] = {"thinkingBudget": budget}
+    return config
+
+
+def apply_length_hint(prompt: str, profile: Dict[str, Any]) -> str:
+    hint = profile.get("length_hint")
+    return f"{prompt}\n\n{hint}" if hint else prompt
+
+
+# ----------------------------
+# Latency stats
+# ----------------------------
+STATS_WINDOW = 200
+# Set AI_PROFILE_STATS=path.json to dump the stats when the process exits.
+PROFILE_STATS_PATH = os.getenv("AI_PROFILE_STATS")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of samples (pct in 0..100). Returns 0.0 for no samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class ProfileStats:
+    """Thread-safe rolling latency samples per profile."""
+    def __init__(self, window: int = STATS_WINDOW):
+        self._window = window
+        self._latencies: Dict[str, deque] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, profile: str, latency: float, ok: bool, output_tokens: int = 0):
+        with self._lock:
+            samples = self._latencies.setdefault(profile, deque(maxlen=self._window))
+            counts = self._counts.setdefault(profile, {"requests": 0, "errors": 0, "output_tokens": 0})
+            counts["requests"] += 1
+            counts["output_tokens"] += output_tokens
+            if ok:
+                samples.append(latency)
+            else:
+                counts["errors"] += 1
+
+    def latencies(self, profile: str) -> List[float]:
+        with self._lock:
+            return list(self._latencies.get(profile, ()))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns {profile: {requests, errors, avg_output_tokens, p50, p95, p99, max}} in seconds."""
+        with self._lock:
+            result = {}
+            for name, counts in self._counts.items():
+                samples = list(self._latencies.get(name, ()))
+                ok = counts["requests"] - counts["errors"]
+                result[name] = {
+                    "requests": counts["requests"],
+                    "errors": counts["errors"],
+                    "avg_output_tokens": round(counts["output_tokens"] / ok, 1) if ok else 0,
+                    "p50": round(percentile(samples, 50), 3),
+                    "p95": round(percentile(samples, 95), 3),
+                    "p99": round(percentile(samples, 99), 3),
+                    "max": round(max(samples), 3) if samples else 0.0,
+                }
+            return result
+
+
+profile_stats = ProfileStats()
+
+
+def _dump_stats():
+    snapshot = profile_stats.snapshot()
+    if snapshot:
+        with open(PROFILE_STATS_PATH, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2)
+
+
+if PROFILE_STATS_PATH:
+    atexit.register(_dump_stats)
@@ -0,0 +1,176 @@
+# hedging.py
+"""
+Opt-in hedged requests for ai_client.generate.
+
+If the primary request has not answered after an adaptive delay (the rolling
+AI_HEDGE_PERCENTILE latency of the profile, see generation_profiles.profile_stats), or
+failed fast with a transient error (5xx, timeout, connection), a duplicate is sent to a
+second backend and whichever answers first wins. Errors a duplicate would only repeat or
+make worse (4xx including 429 rate limits, blocked or empty answers) are not hedged.
+
+The losing attempt is not aborted: requests cannot interrupt a call in flight, so it runs
+to completion (or its timeout) in a daemon thread and its result is discarded.
+
+    AI_HEDGE=same       duplicate to the same Gemini model
+    AI_HEDGE=ollama     duplicate to the local Ollama model (gemma_client.generate)
+    AI_HEDGE_PROFILES   comma-separated profiles that may hedge (default: quick_chat)
+    AI_HEDGE_MAX_RATE   at most this fraction of recent requests is hedged (default 0.1)
+
+Hedging is disabled while a cassette records or replays, so cassettes stay deterministic.
+"""
+import os
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+from generation_profiles import percentile, profile_stats
+
+HEDGE_MODE = os.getenv("AI_HEDGE", "").lower()  # "", "same" or "ollama"
+HEDGE_PROFILES = [p.strip() for p in os.getenv("AI_HEDGE_PROFILES", "quick_chat").split(",") if p.strip()]
+HEDGE_MAX_RATE = float(os.getenv("AI_HEDGE_MAX_RATE", "0.1"))
+HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+# Until a profile has this many latency samples, hedge after HEDGE_INITIAL_DELAY seconds.
+HEDGE_MIN_SAMPLES = 20
+HEDGE_INITIAL_DELAY = 3.0
+# Never hedge sooner than this, however fast the profile usually is.
+HEDGE_MIN_DELAY = 0.25
+# Window of recent requests over which HEDGE_MAX_RATE is enforced.
+HEDGE_RATE_WINDOW = 200
+
+# An attempt gets its own requests.Session, closed when the attempt finishes. It returns the
+# result, None for a failure not worth retrying, or raises RetryableError.
+Attempt = Callable[[requests.Session], Optional[Dict[str, Any]]]
+
+
+class RetryableError(Exception):
+    """Raised by an attempt whose failure is transient, so a hedge may still succeed."""
+
+
+def enabled(profile: str) -> bool:
+    return HEDGE_MODE in ("same", "ollama") and profile in HEDGE_PROFILES
+
+
+def hedge_delay(profile: str) -> float:
+    """Seconds to wait for the primary before hedging, from the profile's rolling latencies."""
+    samples = profile_stats.latencies(profile)
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_INITIAL_DELAY
+    return max(HEDGE_MIN_DELAY, percentile(samples, HEDGE_PERCENTILE))
+
+
+class HedgeStats:
+    """Thread-safe hedge counters per profile, plus the rolling budget for HEDGE_MAX_RATE."""
+    def __init__(self, window: int = HEDGE_RATE_WINDOW):
+        self._recent: Dict[str, deque] = {}  # 1 if the request was hedged, else 0
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._window = window
+
+    def _profile(self, profile: str) -> Dict[str, int]:
+        return self._counts.setdefault(profile, {
+            "requests": 0, "hedged": 0, "budget_denied": 0,
+            "primary_wins": 0, "hedge_wins": 0, "failed": 0,
+        })
+
+    def start(self, profile: str):
+        with self._lock:
+            self._profile(profile)["requests"] += 1
+            self._recent.setdefault(profile, deque(maxlen=self._window)).append(0)
+
+    def try_hedge(self, profile: str, max_rate: float = HEDGE_MAX_RATE) -> bool:
+        """Spends hedge budget for the current request if the recent hedge rate allows it."""
+        with self._lock:
+            recent = self._recent.setdefault(profile, deque(maxlen=self._window))
+            counts = self._profile(profile)
+            if sum(recent) + 1 > max(1.0, max_rate * len(recent)):
+                counts["budget_denied"] += 1
+                return False
+            if recent:
+                recent[-1] = 1
+            counts["hedged"] += 1
+            return True
+
+    def outcome(self, profile: str, key: str):
+        with self._lock:
+            self._profile(profile)[key] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns {profile: {requests, hedged, hedge_rate, budget_denied, primary_wins, hedge_wins, failed}}."""
+        with self._lock:
+            result = {}
+            for name, counts in self._counts.items():
+                result[name] = dict(counts)
+                result[name]["hedge_rate"] = round(counts["hedged"] / counts["requests"], 3) if counts["requests"] else 0.0
+            return result
+
+
+hedge_stats = HedgeStats()
+
+
+def _run_attempt(name: str, attempt: Attempt, discarded: threading.Event, results: "queue.Queue"):
+    retryable = False
+    with requests.Session() as session:
+        try:
+            result = attempt(session)
+        except RetryableError:
+            result, retryable = None, True
+        except Exception as e:  # a crashed attempt counts as a failed one
+            print(f"HEDGE ERROR: {name} attempt failed: {type(e).__name__}: {e}")
+            result = None
+    if not discarded.is_set():
+        results.put((name, result, retryable))
+
+
+def hedged_call(profile: str, primary: Attempt, backup: Attempt, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    Runs primary; if it is still running after hedge_delay(profile), or has failed with a
+    RetryableError, and the hedge budget allows, also runs backup. Returns the first
+    successful result (None if all attempts fail or time out). The other attempt keeps
+    running in its thread until it finishes; its result is discarded.
+    """
+    hedge_stats.start(profile)
+    results: "queue.Queue" = queue.Queue()
+    running: Dict[str, threading.Event] = {}
+
+    def launch(name: str, attempt: Attempt):
+        running[name] = discarded = threading.Event()
+        threading.Thread(target=_run_attempt, args=(name, attempt, discarded, results), daemon=True).start()
+
+    launch("primary", primary)
+    pending = 1
+    winner, result = None, None
+    retry_helps = True  # the primary is slow, or failed in a way a second try may fix
+    try:
+        try:
+            name, outcome, retry_helps = results.get(timeout=hedge_delay(profile))
+            pending -= 1
+            if outcome is not None:
+                winner, result = name, outcome
+        except queue.Empty:
+            pass
+
+        if winner is None and retry_helps and hedge_stats.try_hedge(profile):
+            launch("hedge", backup)
+            pending += 1
+
+        while winner is None and pending:
+            try:
+                name, outcome, _retryable = results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            pending -= 1
+            if outcome is not None:
+                winner, result = name, outcome
+    finally:
+        for name, discarded in running.items():
+            if name != winner:
+                discarded.set()
+
+    if winner is None:
+        hedge_stats.outcome(profile, "failed")
+    elif len(running) > 1:
+        hedge_stats.outcome(profile, "primary_wins" if winner == "primary" else "hedge_wins")
+    return result
@@ -0,0 +1,349 @@
+# knowledge_base.py
+"""
+Offline BM25 search over a folder of secure-coding reference docs
+(e.g. OWASP cheat sheets saved as .md/.txt files).
+
+The corpus is compiled once into a compact binary index which is
+memory-mapped at startup, so lookups never parse the whole file:
+
+    python knowledge_base.py build [source_dir] [index_path]
+    python knowledge_base.py search "how do I store passwords"
+"""
+import os
+import re
+import sys
+import math
+import mmap
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+KB_SOURCE_DIR = os.getenv("KB_SOURCE_DIR", "knowledge")
+KB_INDEX_PATH = os.getenv("KB_INDEX_PATH", "knowledge.idx")
+
+# Max characters of reference text attached to a single prompt.
+KB_PROMPT_BUDGET = int(os.getenv("KB_PROMPT_BUDGET", "1500"))
+
+PASSAGE_CHARS = 700
+SOURCE_EXTENSIONS = (".md", ".txt", ".rst")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# A passage is only attached when it scores at least this fraction of the top hit.
+GROUND_MIN_RATIO = 0.5
+# A passage answers a question on its own (no API call) only when it contains
+# every query term, scores above DIRECT_MIN_SCORE and clearly beats the runner-up.
+DIRECT_MIN_SCORE = 8.0
+DIRECT_MIN_MARGIN = 1.5
+DIRECT_MIN_TERMS = 2
+
+# ----------------------------
+# On-disk layout (little endian, all offsets absolute)
+#   header    : magic, version, n_passages, n_terms, avgdl, passages_off, terms_off
+#   passages  : text_off, text_len, doc_len, source_off, source_len
+#   terms     : sorted by term bytes -> str_off, str_len, df, postings_off
+#   postings  : (passage_id, tf) pairs
+#   blobs     : UTF-8 term strings, passage text and source names
+# ----------------------------
+MAGIC = b"SCKB"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIfQQ")
+PASSAGE = struct.Struct("<QIIQH")
+TERM = struct.Struct("<QHIQ")
+POSTING = struct.Struct("<IH")
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from give how i if in into is it its
+me my of on or so that the their then there these this to was what when where which
+why will with you your about briefly explain short tiny what's vs
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases and splits text into index terms, dropping stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+def _split_passages(text: str) -> List[str]:
+    """Packs paragraphs into passages of roughly PASSAGE_CHARS; headings start a new passage."""
+    passages: List[str] = []
+    current = ""
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        starts_section = para.startswith("#")
+        if current and (starts_section or len(current) + len(para) > PASSAGE_CHARS):
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        passages.append(current)
+    return passages
+
+
+def build_index(source_dir: str = KB_SOURCE_DIR, index_path: str = KB_INDEX_PATH) -> int:
+    """
+    Walks source_dir, splits every document into passages and writes the BM25 index.
+    Returns the number of indexed passages.
+    """
+    passages: List[Tuple[str, str]] = []  # (source, text)
+    for root, _dirs, files in os.walk(source_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(SOURCE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            source = os.path.relpath(path, source_dir)
+            passages.extend((source, p) for p in _split_passages(text))
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lens: List[int] = []
+    for pid, (_source, text) in enumerate(passages):
+        counts: Dict[str, int] = {}
+        tokens = tokenize(text)
+        for tok in tokens:
+            counts[tok] = counts.get(tok, 0) + 1
+        for tok, tf in counts.items():
+            postings.setdefault(tok, []).append((pid, min(tf, 0xFFFF)))
+        doc_lens.append(len(tokens))
+
+    avgdl = (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0
+    terms = sorted(postings, key=lambda t: t.encode("utf-8"))
+
+    passages_off = HEADER.size
+    terms_off = passages_off + PASSAGE.size * len(passages)
+    postings_off = terms_off + TERM.size * len(terms)
+
+    postings_blob = bytearray()
+    term_table = bytearray()
+    strings_blob = bytearray()
+    strings_off = postings_off + sum(POSTING.size * len(postings[t]) for t in terms)
+    for term in terms:
+        raw = term.encode("utf-8")
+        term_table += TERM.pack(strings_off + len(strings_blob), len(raw),
+                                len(postings[term]), postings_off + len(postings_blob))
+        strings_blob += raw
+        for pid, tf in postings[term]:
+            postings_blob += POSTING.pack(pid, tf)
+
+    passage_table = bytearray()
+    text_blob = bytearray()
+    text_off = strings_off + len(strings_blob)
+    for pid, (source, text) in enumerate(passages):
+        raw_text = text.encode("utf-8")
+        raw_source = source.encode("utf-8")[:0xFFFF]
+        t_off = text_off + len(text_blob)
+        text_blob += raw_text
+        s_off = text_off + len(text_blob)
+        text_blob += raw_source
+        passage_table += PASSAGE.pack(t_off, len(raw_text), doc_lens[pid], s_off, len(raw_source))
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(passages), len(terms), avgdl, passages_off, terms_off))
+        f.write(passage_table)
+        f.write(term_table)
+        f.write(postings_blob)
+        f.write(strings_blob)
+        f.write(text_blob)
+    os.replace(tmp_path, index_path)
+    return len(passages)
+
+
+class KnowledgeBase:
+    """
+    Read-only view over a memory-mapped BM25 index.
+    Safe to share between threads: searches only slice the mapping.
+    """
+    def __init__(self, index_path: str = KB_INDEX_PATH):
+        self.path = index_path
+        self._mm = None
+        self._file = open(index_path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, version, self.n_passages, self.n_terms,
+             self.avgdl, self._passages_off, self._terms_off) = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{index_path} is not a knowledge base index (v{VERSION})")
+            self._validate()
+        except (OSError, ValueError, struct.error):
+            self.close()
+            raise
+
+    def _validate(self):
+        """Checks every table entry points inside the file, so searches never read out of bounds."""
+        size = len(self._mm)
+        passages_end = self._passages_off + self.n_passages * PASSAGE.size
+        terms_end = self._terms_off + self.n_terms * TERM.size
+        if passages_end > size or terms_end > size:
+            raise ValueError(f"{self.path}: tables run past the end of the file (truncated index?)")
+        for t_off, t_len, _dl, s_off, s_len in PASSAGE.iter_unpack(self._mm[self._passages_off:passages_end]):
+            if t_off + t_len > size or s_off + s_len > size:
+                raise ValueError(f"{self.path}: passage points past the end of the file")
+        for str_off, str_len, df, post_off in TERM.iter_unpack(self._mm[self._terms_off:terms_end]):
+            post_end = post_off + df * POSTING.size
+            if str_off + str_len > size or post_end > size:
+                raise ValueError(f"{self.path}: term points past the end of the file")
+            if df and max(pid for pid, _tf in POSTING.iter_unpack(self._mm[post_off:post_end])) >= self.n_passages:
+                raise ValueError(f"{self.path}: posting refers to a missing passage")
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    # ------------------------------------------------------------------
+    def _find_term(self, term: str) -> Optional[Tuple[int, int]]:
+        """Binary search over the sorted term table. Returns (df, postings_off)."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            str_off, str_len, df, post_off = TERM.unpack_from(self._mm, self._terms_off + mid * TERM.size)
+            candidate = self._mm[str_off:str_off + str_len]
+            if candidate == key:
+                return df, post_off
+            if candidate < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def passage(self, pid: int) -> Tuple[str, str]:
+        """Returns (source, text) for a passage id."""
+        t_off, t_len, _dl, s_off, s_len = PASSAGE.unpack_from(self._mm, self._passages_off + pid * PASSAGE.size)
+        text = self._mm[t_off:t_off + t_len].decode("utf-8")
+        source = self._mm[s_off:s_off + s_len].decode("utf-8")
+        return source, text
+
+    def _doc_len(self, pid: int) -> int:
+        return PASSAGE.unpack_from(self._mm, self._passages_off + pid * PASSAGE.size)[2]
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[int, float, int]]:
+        """
+        Ranks passages for query with BM25.
+        Returns up to k (passage_id, score, matched_terms) tuples, best first.
+        """
+        if not self.n_passages:
+            return []
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        for term in set(tokenize(query)):
+            found = self._find_term(term)
+            if not found:
+                continue
+            df, post_off = found
+            idf = math.log(1 + (self.n_passages - df + 0.5) / (df + 0.5))
+            view = memoryview(self._mm)[post_off:post_off + df * POSTING.size]
+            try:
+                for pid, tf in POSTING.iter_unpack(view):
+                    norm = K1 * (1 - B + B * self._doc_len(pid) / (self.avgdl or 1.0))
+                    scores[pid] = scores.get(pid, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+                    matched[pid] = matched.get(pid, 0) + 1
+            finally:
+                view.release()
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(pid, score, matched[pid]) for pid, score in best]
+
+    # ------------------------------------------------------------------
+    def direct_answer(self, query: str) -> Optional[str]:
+        """Returns a passage that answers query on its own, or None if the match is not strong."""
+        n_terms = len(set(tokenize(query)))
+        if n_terms < DIRECT_MIN_TERMS:
+            return None
+        hits = self.search(query, k=2)
+        if not hits:
+            return None
+        pid, score, matched_terms = hits[0]
+        runner_up = hits[1][1] if len(hits) > 1 else 0.0
+        if matched_terms < n_terms or score < DIRECT_MIN_SCORE or score < runner_up * DIRECT_MIN_MARGIN:
+            return None
+        source, text = self.passage(pid)
+        return f"{text}\n\n(Source: {source})"
+
+    def ground_prompt(self, prompt: str, budget: int = KB_PROMPT_BUDGET) -> str:
+        """Prepends the best matching passages to prompt, keeping them within budget characters."""
+        hits = self.search(prompt, k=5)
+        if not hits or budget <= 0:
+            return prompt
+        top_score = hits[0][1]
+        excerpts: List[str] = []
+        used = 0
+        for pid, score, _matched in hits:
+            if score < top_score * GROUND_MIN_RATIO:
+                break
+            source, text = self.passage(pid)
+            excerpt = f"[{len(excerpts) + 1}] ({source}) {text}"
+            if used + len(excerpt) > budget:
+                if excerpts:
+                    break
+                excerpt = excerpt[:budget]
+            excerpts.append(excerpt)
+            used += len(excerpt)
+        return (
+            "Use these secure-coding reference excerpts where relevant and keep the answer concise.\n\n"
+            + "\n\n".join(excerpts)
+            + f"\n\nQuestion: {prompt}"
+        )
+
+
+# ----------------------------
+# Shared instance
+# ----------------------------
+_kb: Optional[KnowledgeBase] = None
+_kb_loaded = False
+_kb_lock = threading.Lock()
+
+
+def get_knowledge_base() -> Optional[KnowledgeBase]:
+    """Opens the index once per process. Returns None if no index has been built."""
+    global _kb, _kb_loaded
+    with _kb_lock:
+        if not _kb_loaded:
+            _kb_loaded = True
+            if os.path.exists(KB_INDEX_PATH):
+                try:
+                    _kb = KnowledgeBase(KB_INDEX_PATH)
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"KB ERROR: could not open {KB_INDEX_PATH}: {e}")
+        return _kb
+
+
+def prepare_prompt(prompt: str) -> Tuple[Optional[str], str]:
+    """
+    Looks prompt up in the knowledge base.
+    Returns (direct_answer, prompt_to_send); direct_answer is None when the API is still needed.
+    """
+    kb = get_knowledge_base()
+    if kb is None or not prompt.strip():
+        return None, prompt
+    answer = kb.direct_answer(prompt)
+    if answer is not None:
+        return answer, prompt
+    return None, kb.ground_prompt(prompt)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        src = sys.argv[2] if len(sys.argv) > 2 else KB_SOURCE_DIR
+        out = sys.argv[3] if len(sys.argv) > 3 else KB_INDEX_PATH
+        count = build_index(src, out)
+        print(f"Indexed {count} passages from {src} into {out}")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "search":
+        kb = get_knowledge_base()
+        if kb is None:
+            print(f"No index at {KB_INDEX_PATH}. Run: python knowledge_base.py build")
+            sys.exit(1)
+        for pid, score, _matched in kb.search(" ".join(sys.argv[2:]), k=5):
+            source, text = kb.passage(pid)
+            print(f"{score:6.2f}  {source}: {text[:120]!r}")
+    else:
+        print(__doc__)
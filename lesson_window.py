@@ -1,25 +1,35 @@
 import threading
-from typing import Optional
+from typing import Dict, Hashable, Optional
+from chat_history import ChatHistory
 from PySide6.QtWidgets import (
     # 🎯 FIX: Ensure QWidget and other classes are imported
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
-    QTextEdit, QFrame, QApplication, QScrollBar
+    QTextEdit, QFrame, QApplication
 )
-from PySide6.QtCore import Qt, QEvent, QTimer, QThreadPool
-from PySide6.QtGui import QMovie, QTextCursor 
+from PySide6.QtCore import Qt, QEvent, Signal
 from ai_worker import AIWorker
+from render_scheduler import RenderScheduler
+from spinner import Spinner
+
+# Oldest chat paragraphs are dropped beyond this, bounding each window's document. With at
+# most one window per lesson, lesson windows hold at most lessons x MAX_CHAT_BLOCKS paragraphs.
+MAX_CHAT_BLOCKS = 500
 
 class LessonWindow(QWidget):
-    def __init__(self, lesson: dict):
+    closed = Signal()
+
+    def __init__(self, lesson: dict, history: Optional[ChatHistory] = None):
         super().__init__()
         self.lesson = lesson
+        self.history = history
         self.setWindowTitle(self.lesson.get("title", "Lesson"))
         self.setFixedSize(640, 640)
         self.setStyleSheet("background-color: #e6e6e6;")
-        
-        # QThreadPool is no longer used for AI calls, but kept if needed later
-        self.threadpool = QThreadPool()
+        # Free the widget tree (and its spinner movie) as soon as the window is closed
+        self.setAttribute(Qt.WA_DeleteOnClose)
+
         self.challenge_printed = False 
+        self._closed = False
         
         # New attribute to hold the worker reference
         self._current_worker = None 
@@ -50,23 +60,11 @@ class LessonWindow(QWidget):
         self.chat_display = QTextEdit()
         self.chat_display.setReadOnly(True)
         self.chat_display.setStyleSheet("background-color: white; color: #0b3d91; border-radius: 8px; padding: 8px; font-size: 14px;")
+        self.chat_display.document().setMaximumBlockCount(MAX_CHAT_BLOCKS)
         chat_lay.addWidget(self.chat_display, stretch=3)
 
-        # Spinner Initialization (Updated for QMovie)
-        self.spinner = QLabel()
-        self.spinner.setAlignment(Qt.AlignCenter)
-        try:
-            movie = QMovie("spinner.gif")
-            if movie.isValid():
-                self.spinner.setMovie(movie)
-                movie.start()
-            else:
-                # Fallback if the GIF is invalid or not found
-                raise Exception("Invalid or missing spinner.gif")
-        except Exception:
-            # Styled text fallback for when the GIF fails
-            self.spinner.setText("<b style='color:white'>AI is generating...</b>") 
-            
+        # Spinner only animates while shown
+        self.spinner = Spinner()
         self.spinner.hide()
         chat_lay.addWidget(self.spinner)
 
@@ -113,6 +111,23 @@ class LessonWindow(QWidget):
         if start:
             self.append_system_and_stream(start)
 
+    # ------------------------------------------------------------------
+    def closeEvent(self, event):
+        # Drop any in-flight reply and stop the typing animation before the
+        # widgets are deleted (WA_DeleteOnClose).
+        self._closed = True
+        self._release_worker()
+        RenderScheduler.instance().cancel(self.chat_display)
+        self.closed.emit()
+        super().closeEvent(event)
+
+    def _release_worker(self):
+        """Disconnects and forgets the running worker; its thread finishes on its own."""
+        if self._current_worker:
+            self._current_worker.signals.finished.disconnect()
+            self._current_worker.signals.error.disconnect()
+            self._current_worker = None
+
     # ------------------------------------------------------------------
     def eventFilter(self, obj, event):
         if obj == self.input_box and event.type() == QEvent.KeyPress:
@@ -127,26 +142,27 @@ class LessonWindow(QWidget):
     # ------------------------------------------------------------------
     def _on_user_send(self):
         txt = self.input_box.toPlainText().strip()
-        if not txt:
-            return
+        if not txt or self._current_worker is not None:
+            return  # one reply at a time; the text stays in the box until it can be sent
         self.chat_display.append(f"<b>You:</b> {txt}\n")
         self.input_box.clear()
-        self.append_and_stream("<b>AI:</b> ", txt)
+        self.append_and_stream("<b>AI:</b> ", txt, profile="grading")
 
     # ------------------------------------------------------------------
     # Only called once on window startup
     def append_system_and_stream(self, prompt_text: str):
-        self.append_and_stream("<b>AI:</b> ", prompt_text)
+        self.append_and_stream("<b>AI:</b> ", prompt_text, profile="lesson_intro")
 
     # ------------------------------------------------------------------
-    def append_and_stream(self, prefix: str, prompt: str):
+    def append_and_stream(self, prefix: str, prompt: str, profile: str = "grading"):
         self.spinner.show() # Show the spinner when starting the thread
         self.chat_display.append(prefix)
         QApplication.processEvents()
 
-        worker = AIWorker(prompt)
-        worker.signals.finished.connect(self._display_incremental)
-        worker.signals.error.connect(lambda r: self._display_incremental(r))
+        worker = AIWorker(prompt, profile=profile, lesson=self.lesson.get("catalog_title", self.lesson.get("title")))
+        # The prompt is bound to its worker so the history records the pair that belongs together
+        worker.signals.finished.connect(lambda r, p=prompt: self._display_incremental(r, p))
+        worker.signals.error.connect(lambda r, p=prompt: self._display_incremental(r, p))
         
         # Keep a reference to prevent garbage collection while the thread runs
         self._current_worker = worker 
@@ -154,7 +170,9 @@ class LessonWindow(QWidget):
         worker.run() # 🎯 RUN THE WORKER IN A NEW THREAD
 
     # ------------------------------------------------------------------
-    def _display_incremental(self, full_text: Optional[str], chunk: int = 40, delay: int = 30):
+    def _display_incremental(self, full_text: Optional[str], prompt: str = ""):
+        if self._closed:
+            return
         # Clear the worker reference once done
         if self._current_worker:
             del self._current_worker
@@ -165,30 +183,53 @@ class LessonWindow(QWidget):
         if full_text is None:
             self.chat_display.append("<i style='color:red'>API error – check key/network</i>\n")
             return
+        if self.history is not None:
+            self.history.record(self.lesson.get("catalog_title", self.lesson.get("title", "Lesson")), prompt, full_text)
 
-        idx = 0
-        vertical_scroll_bar: QScrollBar = self.chat_display.verticalScrollBar()
-
-        def step():
-            nonlocal idx
-            if idx >= len(full_text):
-                self.chat_display.append("\n") 
-                
-                if not self.challenge_printed:
-                    challenge = self.lesson.get("challenge", "")
-                    if challenge:
-                        self.chat_display.append(f"<b>Challenge:</b> {challenge}\n")
-                        self.challenge_printed = True 
-                
-                return
-
-            end = min(idx + chunk, len(full_text))
-            piece = full_text[idx:end]
-            cur = self.chat_display.textCursor()
-            cur.movePosition(QTextCursor.MoveOperation.End) 
-            cur.insertText(piece)
-            vertical_scroll_bar.setValue(vertical_scroll_bar.maximum())
-            idx = end
-            QTimer.singleShot(delay, step)
-
-        QTimer.singleShot(0, step)
\ No newline at end of file
+        def done():
+            self.chat_display.append("\n") 
+            
+            if not self.challenge_printed:
+                challenge = self.lesson.get("challenge", "")
+                if challenge:
+                    self.chat_display.append(f"<b>Challenge:</b> {challenge}\n")
+                    self.challenge_printed = True 
+
+        # Typed out by the app-wide scheduler shared with every other chat view
+        RenderScheduler.instance().enqueue(self.chat_display, full_text, on_done=done)
+
+
+class LessonWindowRegistry:
+    """
+    Owns the open lesson windows: one window per lesson key, reused and raised on
+    repeated clicks. Windows are never closed behind the learner's back (they may hold
+    notes), so memory is bounded by one window per lesson, each capped at MAX_CHAT_BLOCKS.
+    """
+    def __init__(self, history: Optional[ChatHistory] = None):
+        self.history = history
+        self._windows: Dict[Hashable, LessonWindow] = {}
+
+    def __len__(self):
+        return len(self._windows)
+
+    def open(self, key: Hashable, lesson: dict) -> LessonWindow:
+        win = self._windows.get(key)
+        if win is not None:
+            win.showNormal()
+            win.raise_()
+            win.activateWindow()
+            return win
+
+        win = LessonWindow(lesson, history=self.history)
+        win.closed.connect(lambda k=key, w=win: self._forget(k, w))
+        self._windows[key] = win
+        win.show()
+        return win
+
+    def _forget(self, key: Hashable, win: LessonWindow):
+        if self._windows.get(key) is win:
+            del self._windows[key]
+
+    def close_all(self):
+        for win in list(self._windows.values()):
+            win.close()
@@ -0,0 +1,21 @@
+# lessons.py
+# Lesson catalog shared by the desktop dashboard and the chat server.
+
+LESSONS = [
+    {"title": "Input Validation",
+     "start_prompt": "Give a short intro to input validation: what it is, why it matters, and a tiny Flask example.",
+     "challenge": "Flask /login route: username alnum 3-20 chars, password min 8 chars w/ uppercase+digit. Return JSON status.",
+     "progress": 1.0},
+    {"title": "Auth & Sessions",
+     "start_prompt": "Briefly explain authentication and session management: hashing (bcrypt), secure cookies, session fixation.",
+     "challenge": "Implement secure Flask login: bcrypt hash, secure HttpOnly SameSite cookie, return JWT.",
+     "progress": 0.5},
+    {"title": "Access Control",
+     "start_prompt": "Explain RBAC vs ABAC and why permission checks must happen on every request.",
+     "challenge": "Write a Flask decorator @require_role('admin') and protect /users endpoint; others get 403.",
+     "progress": 0.25},
+    {"title": "Error Handling",
+     "start_prompt": "Explain secure error handling: don't expose stack traces, log safely, return a generic message.",
+     "challenge": "Add global Flask 500 handler which logs exception and returns a safe JSON message.",
+     "progress": 0.0}
+]
@@ -1,17 +1,29 @@
-import os
-import requests
-from dotenv import load_dotenv
+# list_models.py
+"""
+Shows the models available to GEMINI_API_KEY, their limits and latency probe results.
 
-load_dotenv()
+    python list_models.py              # cached list (refetched after MODEL_CACHE_TTL)
+    python list_models.py --refresh    # force a refetch
+    python list_models.py --probe      # time a short request against every candidate model
+"""
+import sys
+from statistics import median
 
-API_KEY = os.getenv("GEMINI_API_KEY")
-URL = f"https://generativelanguage.googleapis.com/v1beta/models?key={API_KEY}"
+from generation_profiles import PROFILES
+from model_registry import is_candidate, list_models, probe_models, probe_results, select_model
 
-resp = requests.get(URL, timeout=10)
-if resp.status_code != 200:
-    print(f"HTTP {resp.status_code}: {resp.text}")
-else:
-    data = resp.json()
-    print("Available models:")
-    for model in data.get("models", []):
-        print(f" - {model['name']} ({model.get('displayName','')})")
+refresh = "--refresh" in sys.argv
+models = list_models(refresh=refresh)
+probes = probe_models() if "--probe" in sys.argv else probe_results()
+
+print("Available models (* = candidate):")
+for name, meta in sorted(models.items()):
+    ok = [p for p in probes.get(name, []) if p.get("ok")]
+    timing = f"  p50 {median(p['latency'] for p in ok):.2f}s" if ok else ""
+    marker = "*" if is_candidate(name, meta) else " "
+    print(f" {marker} {name} ({meta['display_name']})  in {meta['input_token_limit']} / "
+          f"out {meta['output_token_limit']} tokens{timing}")
+
+print("\nSelected model per profile:")
+for profile in PROFILES:
+    print(f" - {profile}: {select_model(profile)}")
@@ -3,6 +3,7 @@ import sys
 from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton
 from PySide6.QtCore import Qt
 from dashboard import DashboardWindow
+import remote_client
 
 class LoginWindow(QWidget):
     def __init__(self):
@@ -42,8 +43,9 @@ class LoginWindow(QWidget):
 
     def handle_login(self):
         if self.username_input.text() and self.password_input.text():
+            remote_client.set_username(self.username_input.text())
             self.hide()
-            self.dashboard = DashboardWindow()
+            self.dashboard = DashboardWindow(username=self.username_input.text())
             self.dashboard.show()
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+# model_registry.py
+"""
+Cached catalogue of the Gemini models available to this API key, with latency probes.
+
+The models list is fetched from the API and cached on disk for MODEL_CACHE_TTL seconds.
+probe_models() sends a tiny prompt to each candidate and keeps the last PROBE_HISTORY
+results per model, which select_model() uses to pick the fastest model that satisfies a
+generation profile. Models that disappear from the list (deprecated/removed) are never
+selected, even if they have old probe results.
+"""
+import os
+import json
+import time
+import threading
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from ai_client import FALLBACK_MODEL, GEMINI_API_BASE, GEMINI_API_KEY, generate
+from generation_profiles import get_profile, model_version
+
+MODEL_REGISTRY_PATH = os.getenv("MODEL_REGISTRY_PATH", ".model_registry.json")
+MODEL_CACHE_TTL = int(os.getenv("MODEL_CACHE_TTL", str(24 * 3600)))
+
+PROBE_PROMPT = "Reply with the single word: ready"
+PROBE_HISTORY = 10
+
+# Models that support generateContent but are not general chat models, or are previews
+# that can be withdrawn without notice.
+EXCLUDED_NAME_PARTS = ("-exp", "preview", "embedding", "aqa", "tts", "image", "live", "audio", "vision", "learnlm")
+
+_lock = threading.Lock()
+
+
+def _load() -> Dict[str, Any]:
+    if os.path.exists(MODEL_REGISTRY_PATH):
+        try:
+            with open(MODEL_REGISTRY_PATH, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"REGISTRY WARNING: ignoring unreadable {MODEL_REGISTRY_PATH}: {e}")
+    return {"fetched_at": 0, "models": {}, "probes": {}}
+
+
+def _save(registry: Dict[str, Any]):
+    tmp_path = MODEL_REGISTRY_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=1)
+    os.replace(tmp_path, MODEL_REGISTRY_PATH)
+
+
+def fetch_models(timeout: int = 10) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Downloads the models list (all pages). Returns {name: metadata} or None on error."""
+    if not GEMINI_API_KEY:
+        print("API ERROR: GEMINI_API_KEY is not set. Check your .env file.")
+        return None
+    models: Dict[str, Dict[str, Any]] = {}
+    page_token = ""
+    try:
+        while True:
+            params = {"key": GEMINI_API_KEY, "pageSize": 1000}
+            if page_token:
+                params["pageToken"] = page_token
+            resp = requests.get(f"{GEMINI_API_BASE}/models", params=params, timeout=timeout)
+            resp.raise_for_status()
+            data = resp.json()
+            for model in data.get("models", []):
+                name = model["name"].split("/", 1)[-1]
+                models[name] = {
+                    "display_name": model.get("displayName", ""),
+                    "description": model.get("description", ""),
+                    "input_token_limit": model.get("inputTokenLimit", 0),
+                    "output_token_limit": model.get("outputTokenLimit", 0),
+                    "methods": model.get("supportedGenerationMethods", []),
+                }
+            page_token = data.get("nextPageToken", "")
+            if not page_token:
+                return models
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"REGISTRY ERROR: could not list models: {type(e).__name__}: {e}")
+        return None
+
+
+def list_models(refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Returns the cached models list, refetching it when older than MODEL_CACHE_TTL (or refresh=True)."""
+    with _lock:
+        registry = _load()
+        if refresh or time.time() - registry["fetched_at"] > MODEL_CACHE_TTL:
+            models = fetch_models()
+            if models is not None:
+                registry["models"] = models
+                registry["fetched_at"] = time.time()
+                # Forget probe results of models that no longer exist.
+                registry["probes"] = {n: p for n, p in registry["probes"].items() if n in models}
+                _save(registry)
+        return registry["models"]
+
+
+def probe_results() -> Dict[str, List[Dict[str, Any]]]:
+    """Returns the stored probe history per model."""
+    with _lock:
+        return _load()["probes"]
+
+
+def is_candidate(name: str, meta: Dict[str, Any]) -> bool:
+    """True for current, general-purpose chat models."""
+    if "generateContent" not in meta.get("methods", []):
+        return False
+    if not name.startswith("gemini") or any(part in name for part in EXCLUDED_NAME_PARTS):
+        return False
+    text = f"{meta.get('display_name', '')} {meta.get('description', '')}".lower()
+    return "deprecated" not in text
+
+
+def meets_requirements(meta: Dict[str, Any], profile: Dict[str, Any]) -> bool:
+    """Checks a model's limits against what a generation profile needs."""
+    if profile.get("max_output_tokens", 0) > meta.get("output_token_limit", 0):
+        return False
+    return profile.get("min_input_tokens", 0) <= meta.get("input_token_limit", 0)
+
+
+# ----------------------------
+# Probing
+# ----------------------------
+def probe_model(name: str) -> Dict[str, Any]:
+    """Times one short generation against name and returns the probe record."""
+    result = generate(PROBE_PROMPT, profile="probe", model=name)
+    record: Dict[str, Any] = {"at": round(time.time()), "ok": result is not None}
+    if result is not None:
+        tokens = result["usage"].get("candidatesTokenCount", 0) + result["usage"].get("thoughtsTokenCount", 0)
+        record["latency"] = round(result["latency"], 3)
+        record["tokens_per_s"] = round(tokens / result["latency"], 1) if result["latency"] else 0.0
+    return record
+
+
+def probe_models(names: Optional[List[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Probes the given models (default: all candidates) and stores rolling results."""
+    models = list_models()
+    if names is None:
+        names = [n for n, meta in models.items() if is_candidate(n, meta)]
+    records = {name: probe_model(name) for name in names}
+    with _lock:
+        registry = _load()
+        for name, record in records.items():
+            history = registry["probes"].setdefault(name, [])
+            history.append(record)
+            del history[:-PROBE_HISTORY]
+        _save(registry)
+        return registry["probes"]
+
+
+def expected_latency(probes: List[Dict[str, Any]], profile: Dict[str, Any]) -> Optional[float]:
+    """
+    Estimates seconds for a full reply under profile: median probe latency plus the time
+    to generate max_output_tokens at the median probed throughput.
+    """
+    ok = [p for p in probes if p.get("ok")]
+    if not ok:
+        return None
+    latency = median(p["latency"] for p in ok)
+    tps = median(p.get("tokens_per_s", 0.0) for p in ok)
+    tokens = profile.get("max_output_tokens", 0)
+    return latency + (tokens / tps if tps and tokens else 0.0)
+
+
+def _recency_key(name: str):
+    """Ranks unprobed models: newest version first, then the faster flash tiers, then the base name."""
+    return model_version(name), "flash" in name, "lite" not in name, -len(name)
+
+
+def select_model(profile_name: str) -> str:
+    """
+    Returns the fastest probed candidate that meets the profile's requirements.
+    Without probe data, prefers FALLBACK_MODEL if it is still listed, else the newest one.
+    """
+    profile = get_profile(profile_name)
+    models = list_models()
+    probes = probe_results()
+    eligible = [n for n, meta in models.items() if is_candidate(n, meta) and meets_requirements(meta, profile)]
+    if not eligible:
+        return FALLBACK_MODEL
+    timed = [(expected_latency(probes.get(n, []), profile), n) for n in eligible]
+    timed = [(t, n) for t, n in timed if t is not None]
+    if timed:
+        return min(timed)[1]
+    if FALLBACK_MODEL in eligible:
+        return FALLBACK_MODEL
+    return max(eligible, key=_recency_key)
@@ -0,0 +1,39 @@
+# rate_limiter.py
+import time
+import threading
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rate` calls per second with bursts of up to `burst`.
+    A rate of 0 (or less) disables limiting.
+    """
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = max(1, burst if burst is not None else int(rate) or 1)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes one slot and returns how many seconds the caller must wait before using it.
+        Never blocks, so it can also be used from async code (await asyncio.sleep(delay)).
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Blocks until a slot is available."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
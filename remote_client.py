@@ -0,0 +1,74 @@
+# remote_client.py
+"""
+Thin-client side of chat_server.py. When CHAT_SERVER_URL is set the desktop windows send
+their prompts to the shared server instead of calling Gemini themselves, so a classroom
+shares one cache, connection pool and quota.
+"""
+import os
+import threading
+import requests
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHAT_SERVER_URL = os.getenv("CHAT_SERVER_URL", "").rstrip("/")
+REMOTE_TIMEOUT = 60
+
+_http = requests.Session()  # keep-alive connection to the server
+_lock = threading.Lock()
+_session_id: Optional[str] = None
+_username = "learner"
+
+
+def set_username(username: str):
+    """Sets the name used when the server session is created (call before the first request)."""
+    global _username
+    _username = username or "learner"
+
+
+def _ensure_session() -> Optional[str]:
+    global _session_id
+    with _lock:
+        if _session_id is None:
+            try:
+                resp = _http.post(f"{CHAT_SERVER_URL}/api/sessions", json={"username": _username}, timeout=10)
+                resp.raise_for_status()
+                _session_id = resp.json()["session_id"]
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                print(f"SERVER ERROR: could not open a session on {CHAT_SERVER_URL}: {e}")
+        return _session_id
+
+
+def get_lessons() -> Optional[List[Dict[str, Any]]]:
+    """Fetches the lesson catalog from the server, or None if it is unreachable."""
+    try:
+        resp = _http.get(f"{CHAT_SERVER_URL}/api/lessons", timeout=10)
+        resp.raise_for_status()
+        return resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"SERVER ERROR: could not load lessons from {CHAT_SERVER_URL}: {e}")
+        return None
+
+
+def get_response(prompt: str, profile: str, lesson: Optional[str] = None) -> Optional[str]:
+    """
+    Asks the server for a reply. Returns None on any error, like ai_client.get_response.
+    lesson (a catalog title) lets the server answer scripted lesson questions from its content pack.
+    """
+    global _session_id
+    session_id = _ensure_session()
+    if session_id is None:
+        return None
+    try:
+        resp = _http.post(f"{CHAT_SERVER_URL}/api/sessions/{session_id}/messages",
+                          json={"text": prompt, "profile": profile, "lesson": lesson}, timeout=REMOTE_TIMEOUT)
+        if resp.status_code == 404:
+            # The server restarted or expired the session; open a new one next time.
+            with _lock:
+                _session_id = None
+        resp.raise_for_status()
+        return resp.json()["reply"]
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"SERVER ERROR: {type(e).__name__}: {e}")
+        return None
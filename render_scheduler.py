@@ -0,0 +1,146 @@
+# render_scheduler.py
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, List, Optional
+
+from PySide6.QtWidgets import QApplication, QTextEdit
+from PySide6.QtGui import QTextCursor
+from PySide6.QtCore import QObject, QTimer, Qt
+
+# Time all chat views together may spend inserting text per frame.
+FRAME_BUDGET_MS = 4.0
+# Typing speed when there is little to show (about the old 35 chars / 25 ms).
+MIN_CHARS_PER_FRAME = 20
+# Any reply finishes animating within this time; longer replies type faster.
+MAX_ANIMATION_SECONDS = 1.5
+# With more than this many characters pending across all views, skip the animation.
+DROP_ANIMATION_CHARS = 6000
+# Scrollbar slack (px) within which a view still counts as "scrolled to the bottom".
+BOTTOM_SLACK = 4
+
+
+class _Stream:
+    """Pending text for one chat view: FIFO of [text, position, on_done]."""
+    def __init__(self):
+        self.jobs: Deque[list] = deque()
+
+    @property
+    def backlog(self) -> int:
+        return sum(len(job[0]) - job[1] for job in self.jobs)
+
+
+class RenderScheduler(QObject):
+    """
+    App-wide typing animation for chat views.
+
+    Instead of every window running its own QTimer.singleShot chain, pending text for
+    all views is drained on one timer ticking at the display refresh rate. Each tick
+    inserts at most one coalesced chunk per view, sized to keep the whole tick within
+    FRAME_BUDGET_MS, and only follows the text with the scrollbar if the user has not
+    scrolled up.
+    """
+    _instance: Optional["RenderScheduler"] = None
+
+    @classmethod
+    def instance(cls) -> "RenderScheduler":
+        if cls._instance is None:
+            cls._instance = RenderScheduler(QApplication.instance())
+        return cls._instance
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._streams: "OrderedDict[QTextEdit, _Stream]" = OrderedDict()
+        self._ms_per_char = 0.002  # running estimate of insertion cost
+        screen = QApplication.primaryScreen()
+        refresh = screen.refreshRate() if screen is not None else 60.0
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.setInterval(max(1, int(1000 / (refresh or 60.0))))
+        self._timer.timeout.connect(self._tick)
+        self._frames_to_drain = max(1, int(MAX_ANIMATION_SECONDS * 1000 / self._timer.interval()))
+
+    # ------------------------------------------------------------------
+    def enqueue(self, view: QTextEdit, text: str, on_done: Optional[Callable[[], None]] = None):
+        """Queues text to be typed at the end of view; on_done runs once it is all shown."""
+        stream = self._streams.get(view)
+        if stream is None:
+            stream = self._streams[view] = _Stream()
+            view.destroyed.connect(lambda _obj=None, v=view: self._streams.pop(v, None))
+        stream.jobs.append([text, 0, on_done])
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def cancel(self, view: QTextEdit):
+        """Drops everything still pending for view without running its callbacks."""
+        stream = self._streams.get(view)
+        if stream is not None:
+            stream.jobs.clear()
+
+    def flush(self, view: Optional[QTextEdit] = None):
+        """Shows all pending text immediately (for one view, or every view)."""
+        views = [view] if view is not None else list(self._streams)
+        for v in views:
+            stream = self._streams.get(v)
+            while stream and stream.jobs:
+                text, pos, on_done = stream.jobs.popleft()
+                self._insert(v, text[pos:])
+                if on_done:
+                    on_done()  # right after its own text, before the next job's (as in _tick)
+        self._finish([])
+
+    # ------------------------------------------------------------------
+    def _tick(self):
+        total = sum(stream.backlog for stream in self._streams.values())
+        if total > DROP_ANIMATION_CHARS:
+            self.flush()
+            return
+
+        start = time.perf_counter()
+        done: List[Callable[[], None]] = []
+        views = [(view, stream) for view, stream in self._streams.items() if stream.jobs]
+        for i, (view, stream) in enumerate(views):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            share_ms = (FRAME_BUDGET_MS - elapsed_ms) / (len(views) - i)
+            wanted = max(MIN_CHARS_PER_FRAME, math.ceil(stream.backlog / self._frames_to_drain))
+            affordable = int(share_ms / self._ms_per_char) if share_ms > 0 else 0
+            budget = max(1, min(wanted, affordable))
+
+            # Coalesce this frame's text for the view into a single insert.
+            pieces: List[str] = []
+            while budget > 0 and stream.jobs:
+                job = stream.jobs[0]
+                text, pos, on_done = job
+                piece = text[pos:pos + budget]
+                pieces.append(piece)
+                budget -= len(piece)
+                job[1] = pos + len(piece)
+                if job[1] >= len(text):
+                    stream.jobs.popleft()
+                    if on_done:
+                        done.append(on_done)
+                        break  # on_done may append to the view; let it run first
+            chunk = "".join(pieces)
+            if chunk:
+                t0 = time.perf_counter()
+                self._insert(view, chunk)
+                cost = (time.perf_counter() - t0) * 1000 / len(chunk)
+                self._ms_per_char = 0.8 * self._ms_per_char + 0.2 * cost
+
+        self._finish(done)
+
+    def _finish(self, done: List[Callable[[], None]]):
+        for on_done in done:
+            on_done()
+        if not any(stream.jobs for stream in self._streams.values()):
+            self._timer.stop()
+
+    @staticmethod
+    def _insert(view: QTextEdit, text: str):
+        bar = view.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum() - BOTTOM_SLACK
+        cur = QTextCursor(view.document())
+        cur.movePosition(QTextCursor.MoveOperation.End)
+        cur.insertText(text)
+        if at_bottom:
+            bar.setValue(bar.maximum())
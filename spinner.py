@@ -0,0 +1,32 @@
+# spinner.py
+from PySide6.QtWidgets import QLabel
+from PySide6.QtGui import QMovie
+from PySide6.QtCore import Qt
+
+
+class Spinner(QLabel):
+    """
+    "AI is generating" indicator shared by the dashboard and lesson windows.
+    The GIF only animates while the label is actually visible, so hidden spinners
+    (and spinners inside hidden windows) cost no timer ticks or repaints.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAlignment(Qt.AlignCenter)
+        self._movie = QMovie("spinner.gif", parent=self)
+        if self._movie.isValid():
+            self.setMovie(self._movie)
+        else:
+            # Styled text fallback for when the GIF is invalid or missing
+            self._movie = None
+            self.setText("<b style='color:white'>AI is generating...</b>")
+
+    def showEvent(self, event):
+        if self._movie is not None:
+            self._movie.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        if self._movie is not None:
+            self._movie.stop()
+        super().hideEvent(event)
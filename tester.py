@@ -5,6 +5,7 @@ import json
 from datetime import datetime
 from typing import Any, Dict, List
 import threading
+import os
 
 from PySide6.QtWidgets import QApplication, QPushButton, QLineEdit, QTextEdit
 from PySide6.QtCore import QTimer, Qt
@@ -15,6 +16,19 @@ from main import LoginWindow
 from dashboard import DashboardWindow
 from lesson_window import LessonWindow
 from ai_client import get_response  # replace with actual AI call
+from cassette import get_cassette
+from hedging import hedge_stats
+import bench_history
+
+def current_rss_mb():
+    """Resident memory of this process in MB (Linux /proc), or "n/a" elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        return "n/a"
+
 
 class Tester:
     def __init__(self):
@@ -23,6 +37,7 @@ class Tester:
             "timestamp": "",
             "functional": [],
             "performance": [],
+            "memory": [],
             "ui_accessibility": [],
             "error_handling": [],
             "observations": ""
@@ -35,6 +50,14 @@ class Tester:
         self.contrast_passed = 0
         self.contrast_total = 0
         self.focus_issues: List[str] = []
+        # Raw samples for the benchmark history / regression gate
+        self.samples: Dict[str, List[float]] = {
+            "client_latency_s": [],
+            "lesson_open_ms": [],
+            "rss_after_lessons_mb": [],
+            "rss_after_close_mb": [],
+        }
+        self.exit_code = 0
 
     def run(self):
         print("Launching app and running automated tests...")
@@ -44,6 +67,7 @@ class Tester:
         login.show()
         QTimer.singleShot(1000, lambda: self.auto_login(login))
         self.app.exec()
+        return self.exit_code
 
     # ---------------- Functional Tests ----------------
     def auto_login(self, login: LoginWindow):
@@ -72,6 +96,8 @@ class Tester:
                 response = get_response(test["input"])
                 self.api_latency = time.time() - start
                 pass_fail = "Pass" if response else "Fail"
+                if response:
+                    self.samples["client_latency_s"].append(self.api_latency)
             except Exception as e:
                 response = str(e)
                 pass_fail = "Fail"
@@ -93,21 +119,64 @@ class Tester:
         for idx, prompt in enumerate(prompts):
             start = time.time()
             try:
-                get_response(prompt)
+                response = get_response(prompt)
                 end = time.time()
-                duration = end - start
+                duration = end - start if response else None
             except Exception:
+                end = time.time()
                 duration = None
+            if duration is not None:
+                self.samples["client_latency_s"].append(duration)
             self.report["performance"].append({
                 "Test ID": f"P{idx+1}",
                 "Input": prompt,
                 "Backend": "Gemini",
                 "Time Start": start,
                 "Time End": end,
-                "Response Time (s)": round(duration, 3) if duration else "Error",
+                "Response Time (s)": round(duration, 3) if duration is not None else "Error",
                 "Notes": ""
             })
 
+        QTimer.singleShot(500, self.test_memory)
+
+    # ---------------- Memory ----------------
+    def test_memory(self):
+        dashboard = self.find_window(DashboardWindow)
+        before = current_rss_mb()
+        clicks = 5
+        for _ in range(clicks):
+            for idx in range(len(dashboard.lessons)):
+                start = time.perf_counter()
+                dashboard.open_lesson_window(idx)
+                self.app.processEvents()
+                self.samples["lesson_open_ms"].append((time.perf_counter() - start) * 1000)
+        opened = current_rss_mb()
+        if isinstance(opened, float):
+            self.samples["rss_after_lessons_mb"].append(opened)
+        self.report["memory"].append({
+            "Test ID": "M1",
+            "Scenario": f"Click every lesson {clicks}x",
+            "RSS Before (MB)": before,
+            "RSS After (MB)": opened,
+            "Lesson Windows": len(dashboard.lesson_windows),
+            "Notes": "Registry reuses one window per lesson (at most MAX_CHAT_BLOCKS paragraphs each)"
+        })
+        dashboard.lesson_windows.close_all()
+        QTimer.singleShot(500, lambda: self._memory_after_close(opened))
+
+    def _memory_after_close(self, opened):
+        alive = sum(1 for w in self.app.topLevelWidgets() if isinstance(w, LessonWindow))
+        closed = current_rss_mb()
+        if isinstance(closed, float):
+            self.samples["rss_after_close_mb"].append(closed)
+        self.report["memory"].append({
+            "Test ID": "M2",
+            "Scenario": "Close all lesson windows",
+            "RSS Before (MB)": opened,
+            "RSS After (MB)": closed,
+            "Lesson Windows": alive,
+            "Notes": "Windows are deleted on close"
+        })
         QTimer.singleShot(500, self.test_ui_accessibility)
 
     # ---------------- UI / Accessibility ----------------
@@ -200,6 +269,8 @@ class Tester:
 
         self.generate_report()
         print("All tests complete! Report generated.")
+        if self.exit_code:
+            print("PERFORMANCE REGRESSION: see the Regression Gate section of the report.")
         self.app.quit()
 
     # ---------------- Utility Functions ----------------
@@ -213,6 +284,32 @@ class Tester:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"TESTING_REPORT_{timestamp}.md"
 
+        tape = get_cassette()
+        if tape is not None:
+            self.report["observations"] += (
+                f"\nAI traffic: cassette {tape.mode} ({tape.path}), "
+                f"{tape.hits} replayed, {len(tape.misses)} misses.\n"
+            )
+            for prompt in sorted(set(tape.misses)):
+                first_line = prompt.splitlines()[0][:80] if prompt else ""
+                self.report["observations"] += f"- CASSETTE MISS ({tape.misses.count(prompt)}x): `{first_line}`\n"
+
+        # Benchmark history: compare against earlier runs, then store this one
+        history = bench_history.load_history()
+        run = bench_history.make_run(self.samples)
+        findings = bench_history.compare(run, history)
+        baseline_count = len(bench_history.baseline_runs(run, history))
+        bench_history.append_run(run)
+        if bench_history.regressions(findings):
+            self.exit_code = 1
+
+        for profile, counts in hedge_stats.snapshot().items():
+            self.report["observations"] += (
+                f"\nHedged requests ({profile}): {counts['hedged']}/{counts['requests']} hedged, "
+                f"{counts['hedge_wins']} won by the hedge, {counts['primary_wins']} by the primary, "
+                f"{counts['budget_denied']} denied by the rate cap, {counts['failed']} failed.\n"
+            )
+
         def table_from_list(data: List[Dict[str, Any]]):
             if not data:
                 return ""
@@ -238,19 +335,35 @@ class Tester:
 
 ---
 
-## 3. UI / Accessibility Testing
+## 3. Memory
+{table_from_list(self.report["memory"])}
+
+---
+
+## 4. UI / Accessibility Testing
 {table_from_list(self.report["ui_accessibility"])}
 
 ---
 
-## 4. Error Handling
+## 5. Error Handling
 {table_from_list(self.report["error_handling"])}
 
 ---
 
-## 5. Notes / Observations
+## 6. Notes / Observations
 {self.report["observations"]}
 
+---
+
+## 7. Regression Gate
+{bench_history.summary_markdown(findings, baseline_count)}
+
+---
+
+## 8. Benchmark Trends
+Run `{run["run_id"]}` on {run["env"]["platform"]} {run["env"]["machine"]}, Python {run["env"]["python"]}, commit {run["env"]["commit"] or "n/a"}, AI traffic: {run["env"]["cassette"]}.
+{bench_history.trend_markdown(run, history)}
+
 """
 
         with open(filename, "w") as f:
@@ -261,4 +374,4 @@ class Tester:
 # ---------------- Run Tester ----------------
 if __name__ == "__main__":
     tester = Tester()
-    tester.run()
+    sys.exit(tester.run())